@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import pickle
+import uuid
+import zlib
+from typing import Optional
+
+from schedule import Schedule
+from scenario import build_simulator
+from simulator import Simulator
+
+# modules whose code changes the result of a simulation or the record and KPIs stored with it
+SIMULATION_MODULES = ['cache', 'calendars', 'demand', 'event', 'kpi', 'randomness', 'schedule', 'scenario',
+                      'simulator', 'streams', 'terminal', 'timeline', 'track', 'train']
+
+
+def code_version() -> str:
+    """
+    Returns: hash of the source of the simulation modules
+    """
+
+    digest = hashlib.sha256()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for module in SIMULATION_MODULES:
+        with open(os.path.join(folder, module + '.py'), 'rb') as file:
+            digest.update(file.read())
+
+    return digest.hexdigest()[:16]
+
+
+CODE_VERSION = code_version()
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_scenario(scenario: dict) -> dict:
+    """
+    Scenario with the defaults of scenario.build_simulator filled in and the trains and terminals
+    sorted by id, so equivalent scenarios have the same representation.
+    Streams read from csv files are represented by the content of the file, not by its path.
+    """
+
+    streams = scenario.get('streams')
+    if streams is not None:
+        streams = [dict(info, csv=file_digest(info['csv'])) if 'csv' in info else info for info in streams]
+
+    trains = [dict({'location': None, 'is_ready': False}, **info) for info in scenario['trains']]
+    terminals = [dict({'has_demand': True}, **info) for info in scenario['terminals']]
+
+    return _normalize({
+        'trains': sorted(trains, key=lambda info: str(info['id'])),
+        'terminals': sorted(terminals, key=lambda info: str(info['id'])),
+        'days': scenario['days'],
+        'initial_info': scenario['initial_info'],
+        'terminals_graph': scenario['terminals_graph'],
+        'tracks': scenario.get('tracks'),
+        'streams': streams,
+        'durations': scenario.get('durations'),
+    })
+
+
+def scenario_key(scenario: dict, seed: int = None, antithetic: bool = False) -> str:
+    """
+    Returns: content hash of the normalized scenario, the seed and the code version.
+    No seed is the seed 0, as in scenario.build_simulator.
+    """
+
+    content = json.dumps([normalize_scenario(scenario), seed or 0, antithetic, CODE_VERSION],
+                         sort_keys=True, separators=(',', ':'))
+
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def compact_result(simulator: Simulator) -> dict:
+    """
+    Returns: compact record with the totals of a finished simulation
+    """
+
+    operated = simulator.total_operated_demand_per_train
+
+    return {
+        'tons': sum(operated.values()),
+        'tons_per_train': dict(operated),
+        'events': len(simulator.scheduler.events_log),
+        'end_time': simulator.time,
+    }
+
+
+class ResultCache:
+    """
+    Results of simulations on local disk, one compressed file per key, evicted by least recent use
+    when the size of the folder goes over the limit. The modification time of a file is its last use.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1 << 30) -> None:
+        """
+        Constructor method
+        Params:
+            - root (str): folder of the cache
+            - max_bytes (int): maximum size of the cache, in bytes
+        """
+
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key + '.entry')
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self.path(key), 'rb') as file:
+                entry = pickle.loads(zlib.decompress(file.read()))
+            os.utime(self.path(key))
+        except (FileNotFoundError, zlib.error, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: dict):
+        tmp = os.path.join(self.root, f".{key}.{uuid.uuid4().hex}.tmp")
+        with open(tmp, 'wb') as file:
+            file.write(zlib.compress(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp, self.path(key))
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits its size
+        """
+
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith('.entry'):
+                try:
+                    stat = os.stat(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def cached_simulate(scenario: dict, cache: ResultCache, seed: int = None, output_path: str = None,
+                    antithetic: bool = False) -> dict:
+    """
+    Simulate a scenario, or take its result from the cache
+    Params:
+        - scenario (dict): scenario, as accepted by scenario.build_simulator
+        - cache (ResultCache): cache of results
+        - seed (int): seed of the replication
+        - antithetic (bool): flag to mirror the random numbers of the seed
+        - output_path (str): path of the log sheet. If None, no sheet is written.
+    Return: entry with the compact record, the statistics, the events log and the KPIs of the simulation
+    """
+
+    seed = seed or 0
+    key = scenario_key(scenario, seed, antithetic)
+    entry = cache.get(key)
+
+    if entry is None:
+        simulator = build_simulator(scenario, seed=seed, antithetic=antithetic, log=False, hot_path=True)
+        simulator.simulate(output_path=None)
+
+        entry = {
+            'key': key,
+            'record': compact_result(simulator),
+            'statistics': simulator.statistics,
+            'events_log': simulator.scheduler.events_log,
+            'kpis': simulator.kpi.compute(),
+            'sheet': None,
+        }
+        changed = True
+    else:
+        changed = False
+
+    if output_path is not None:
+        if entry['sheet'] is None:
+            schedule = Schedule()
+            schedule.events_log = entry['events_log']
+            schedule.build_log_sheet(path=output_path)
+            with open(output_path, 'rb') as file:
+                entry['sheet'] = file.read()
+            changed = True
+        else:
+            with open(output_path, 'wb') as file:
+                file.write(entry['sheet'])
+
+    if changed:
+        cache.put(key, entry)
+
+    return entry
+
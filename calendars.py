@@ -0,0 +1,124 @@
+from bisect import bisect_right
+from typing import List, Optional, Sequence, Tuple
+
+MINUTES_PER_DAY = 24*60
+
+
+class Calendar:
+    """
+    Closures of a terminal or a train (shift changes, maintenance), as sorted arrays of disjoint intervals
+    [start, end) in minutes. A max tree over the gaps between closures finds the first gap long enough
+    for an operation in O(log n).
+    """
+
+    def __init__(self, closures: Sequence[Tuple[int, int]]) -> None:
+        """
+        Constructor method
+        Params:
+            - closures (list): intervals (start, end), in minutes, where the operation is not possible.
+                Overlapping and touching intervals are merged.
+        """
+
+        self.starts: List[int] = list()
+        self.ends: List[int] = list()
+
+        for start, end in sorted((int(start), int(end)) for start, end in closures if end > start):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+        # gaps[i] is the free time after the closure i
+        n = len(self.starts)
+        gaps = [self.starts[i + 1] - self.ends[i] for i in range(n - 1)] + [float('inf')]
+
+        self.size = 1
+        while self.size < max(n, 1):
+            self.size *= 2
+        self.tree = [float('-inf')]*(2*self.size)
+        self.tree[self.size:self.size + n] = gaps
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2*node], self.tree[2*node + 1])
+
+    @classmethod
+    def repeat(cls, closures: Sequence[Tuple[int, int]], period: int, horizon: int,
+               extra: Sequence[Tuple[int, int]] = ()) -> 'Calendar':
+        """
+        Build a calendar with closures repeated every period until the horizon, like daily shift changes
+        Params:
+            - closures (list): intervals (start, end) within the first period
+            - period (int): length of the period, in minutes
+            - horizon (int): last instant covered, in minutes
+            - extra (list): other closures, like planned maintenance
+        """
+
+        repeated = [(offset + start, offset + end)
+                    for offset in range(0, horizon + period, period)
+                    for start, end in closures]
+
+        return cls(repeated + list(extra))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def is_open(self, time: int) -> bool:
+        i = bisect_right(self.starts, time) - 1
+        return i < 0 or time >= self.ends[i]
+
+    def first_gap(self, index: int, duration: int) -> int:
+        """
+        Returns: first closure, from the given index on, followed by a gap of at least the duration
+        """
+
+        node, lo, hi = 1, 0, self.size - 1
+        return self._first_gap(node, lo, hi, index, duration)
+
+    def _first_gap(self, node: int, lo: int, hi: int, index: int, duration: int) -> int:
+        if hi < index or self.tree[node] < duration:
+            return -1
+        if lo == hi:
+            return lo
+
+        mid = (lo + hi)//2
+        found = self._first_gap(2*node, lo, mid, index, duration)
+        if found == -1:
+            found = self._first_gap(2*node + 1, mid + 1, hi, index, duration)
+
+        return found
+
+    def next_window(self, time: int, duration: int) -> int:
+        """
+        Find the earliest instant, from the given one on, where an operation of the given duration
+        can start and finish without crossing a closure.
+        With a duration of zero, the instant only needs to be out of the closures.
+        """
+
+        i = bisect_right(self.ends, time)   # first closure ending after the instant
+        if i == len(self.starts):
+            return time
+
+        if self.starts[i] <= time:
+            begin, i = self.ends[i], i + 1
+        else:
+            begin = time
+
+        if i == len(self.starts) or self.starts[i] - begin >= duration:
+            return begin
+
+        return self.ends[self.first_gap(i, duration)]
+
+
+def build_calendar(info: Optional[dict], horizon: int) -> Optional[Calendar]:
+    """
+    Build a calendar from a dictionary of parameters:
+        {'daily': [[start, end]] (minutes of the day, repeated every day),
+         'closures': [[start, end]] (minutes of the simulation)}
+    Returns: the calendar, or None if there are no closures
+    """
+
+    if not info:
+        return None
+
+    return Calendar.repeat(closures=info.get('daily', []), period=MINUTES_PER_DAY, horizon=horizon,
+                           extra=info.get('closures', []))
@@ -0,0 +1,633 @@
+import argparse
+import json
+import math
+import os
+import socket
+import socketserver
+import threading
+import time as clock
+import traceback
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from cache import ResultCache, cached_simulate, compact_result
+from scenario import build_simulator
+
+
+def task_id_for(scenario_id: str, seed: int, antithetic: bool = False) -> str:
+    """
+    Returns: deterministic id of a task, so submitting the same task twice has no effect
+    """
+    return f"{scenario_id}--{seed}" + ("--antithetic" if antithetic else "")
+
+
+def run_task(task: dict, scenario: dict, cache: ResultCache = None) -> dict:
+    """
+    Run the simulation of a task, or take its result from the cache
+    Return: compact result record
+    """
+
+    antithetic = task.get('antithetic', False)
+
+    if cache is not None:
+        record = dict(cached_simulate(scenario, cache, seed=task['seed'], antithetic=antithetic)['record'])
+    else:
+        simulator = build_simulator(scenario, seed=task['seed'], antithetic=antithetic, log=False, hot_path=True)
+        simulator.simulate(output_path=None)
+        record = compact_result(simulator)
+
+    record.update(task_id=task['id'], scenario_id=task['scenario_id'], seed=task['seed'],
+                  antithetic=antithetic, paired=task.get('paired', False))
+
+    return record
+
+
+class QueueBackend(ABC):
+    """
+    Interface of the work queues shared by the coordinator and the workers
+    """
+
+    @abstractmethod
+    def put_scenario(self, scenario_id: str, scenario: dict):
+        pass
+
+    @abstractmethod
+    def get_scenario(self, scenario_id: str) -> dict:
+        pass
+
+    @abstractmethod
+    def submit(self, task: dict) -> bool:
+        """
+        Queue a task, unless a task with the same id is already known.
+        Return: True if the task was queued
+        """
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        """
+        Take the next pending task for the given time. Tasks whose lease expires are queued again.
+        """
+
+    @abstractmethod
+    def complete(self, task_id: str, result: dict):
+        pass
+
+    @abstractmethod
+    def fail(self, task_id: str, error: str):
+        """
+        Queue the task again, or give up on it after its maximum number of attempts
+        """
+
+    @abstractmethod
+    def pop_results(self) -> List[dict]:
+        pass
+
+    @abstractmethod
+    def pop_failures(self) -> List[dict]:
+        pass
+
+    @abstractmethod
+    def collected(self, task_id: str) -> Optional[dict]:
+        """
+        Record of a finished task whose result was already popped, for a coordinator started again
+        on the same queues
+        Return: the result, the failed task, or None
+        """
+
+
+class MemoryBackend(QueueBackend):
+    """
+    Thread-safe work queues in the memory of a process
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.scenarios: Dict[str, dict] = {}
+        self.tasks: Dict[str, dict] = {}           # every task submitted, per id
+        self.pending = deque()
+        self.claimed: Dict[str, float] = {}        # task id -> end of the lease
+        self.finished = set()
+        self.results = list()
+        self.failures = list()
+        self.popped: Dict[str, dict] = {}          # task id -> result or failed task already popped
+
+    def put_scenario(self, scenario_id: str, scenario: dict):
+        with self.lock:
+            self.scenarios[scenario_id] = scenario
+
+    def get_scenario(self, scenario_id: str) -> dict:
+        with self.lock:
+            return self.scenarios[scenario_id]
+
+    def submit(self, task: dict) -> bool:
+        with self.lock:
+            if task['id'] in self.tasks:
+                return False
+            self.tasks[task['id']] = task
+            self.pending.append(task['id'])
+            return True
+
+    def requeue_expired(self):
+        now = clock.time()
+        for task_id, deadline in list(self.claimed.items()):
+            if deadline < now:
+                del self.claimed[task_id]
+                self.pending.append(task_id)
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        with self.lock:
+            self.requeue_expired()
+            while self.pending:
+                task_id = self.pending.popleft()
+                if task_id not in self.finished:
+                    self.claimed[task_id] = clock.time() + lease_seconds
+                    return dict(self.tasks[task_id])
+            return None
+
+    def complete(self, task_id: str, result: dict):
+        with self.lock:
+            self.claimed.pop(task_id, None)
+            if task_id not in self.finished:
+                self.finished.add(task_id)
+                self.results.append(result)
+
+    def fail(self, task_id: str, error: str):
+        with self.lock:
+            self.claimed.pop(task_id, None)
+            if task_id in self.finished:
+                return
+            task = self.tasks[task_id]
+            task['attempts'] = task.get('attempts', 0) + 1
+            task['error'] = error
+            if task['attempts'] < task.get('max_attempts', 1):
+                self.pending.append(task_id)
+            else:
+                self.finished.add(task_id)
+                self.failures.append(dict(task))
+
+    def pop_results(self) -> List[dict]:
+        with self.lock:
+            results, self.results = self.results, list()
+            self.popped.update((result['task_id'], result) for result in results)
+            return results
+
+    def pop_failures(self) -> List[dict]:
+        with self.lock:
+            failures, self.failures = self.failures, list()
+            self.popped.update((task['id'], task) for task in failures)
+            return failures
+
+    def collected(self, task_id: str) -> Optional[dict]:
+        with self.lock:
+            return self.popped.get(task_id)
+
+
+class FileSystemBackend(QueueBackend):
+    """
+    Work queues in a directory, possibly shared between machines.
+    A task is claimed by atomically renaming its file from pending to claimed,
+    and results are written to a temporary file renamed in place. Popped results are moved to collected.
+    """
+
+    def __init__(self, root: str) -> None:
+        """
+        Constructor method
+        Params:
+            - root (str): directory of the queues
+        """
+
+        self.root = root
+        for folder in ['scenarios', 'pending', 'claimed', 'results', 'collected', 'failed', 'done']:
+            os.makedirs(os.path.join(root, folder), exist_ok=True)
+
+    def path(self, folder: str, name: str) -> str:
+        return os.path.join(self.root, folder, name + '.json')
+
+    def write(self, folder: str, name: str, content: dict):
+        tmp = os.path.join(self.root, folder, f".{name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp, 'w') as file:
+            json.dump(content, file)
+        os.replace(tmp, self.path(folder, name))
+
+    def read(self, folder: str, name: str) -> dict:
+        with open(self.path(folder, name)) as file:
+            return json.load(file)
+
+    def names(self, folder: str) -> List[str]:
+        return sorted(name[:-5] for name in os.listdir(os.path.join(self.root, folder))
+                      if name.endswith('.json'))
+
+    def put_scenario(self, scenario_id: str, scenario: dict):
+        self.write('scenarios', scenario_id, scenario)
+
+    def get_scenario(self, scenario_id: str) -> dict:
+        return self.read('scenarios', scenario_id)
+
+    def submit(self, task: dict) -> bool:
+        if any(os.path.exists(self.path(folder, task['id'])) for folder in ['pending', 'claimed', 'done', 'failed']):
+            return False
+        self.write('pending', task['id'], task)
+        return True
+
+    def requeue_expired(self, lease_seconds: float):
+        now = clock.time()
+        for task_id in self.names('claimed'):
+            try:
+                if os.path.getmtime(self.path('claimed', task_id)) + lease_seconds < now:
+                    os.rename(self.path('claimed', task_id), self.path('pending', task_id))
+            except FileNotFoundError:
+                pass   # completed or requeued by someone else
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        self.requeue_expired(lease_seconds)
+        for task_id in self.names('pending'):
+            try:
+                # the lease starts now: the mtime is refreshed before the rename, so another worker
+                # can not see the claimed file as expired
+                os.utime(self.path('pending', task_id))
+                os.rename(self.path('pending', task_id), self.path('claimed', task_id))
+                if self.is_finished(task_id):
+                    # completed after its lease expired and it was queued again
+                    os.remove(self.path('claimed', task_id))
+                    continue
+                return self.read('claimed', task_id)
+            except FileNotFoundError:
+                continue   # claimed by another worker
+        return None
+
+    def is_finished(self, task_id: str) -> bool:
+        return os.path.exists(self.path('done', task_id)) or os.path.exists(self.path('failed', task_id))
+
+    def release(self, task_id: str):
+        try:
+            os.remove(self.path('claimed', task_id))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, task_id: str, result: dict):
+        if self.is_finished(task_id):
+            self.release(task_id)
+            return
+        self.write('results', task_id, result)
+        try:
+            os.rename(self.path('claimed', task_id), self.path('done', task_id))
+        except FileNotFoundError:
+            self.write('done', task_id, {'id': task_id})
+
+    def fail(self, task_id: str, error: str):
+        if self.is_finished(task_id):
+            self.release(task_id)
+            return
+        try:
+            task = self.read('claimed', task_id)
+        except FileNotFoundError:
+            return
+        task['attempts'] = task.get('attempts', 0) + 1
+        task['error'] = error
+        folder = 'pending' if task['attempts'] < task.get('max_attempts', 1) else 'failed'
+        self.write(folder, task_id, task)
+        if folder == 'failed':
+            self.write('results', '_failed_' + task_id, task)
+        self.release(task_id)
+
+    def _pop(self, failed: bool) -> List[dict]:
+        records = []
+        for name in self.names('results'):
+            if name.startswith('_failed_') != failed:
+                continue
+            records.append(self.read('results', name))
+            os.replace(self.path('results', name), self.path('collected', name))
+        return records
+
+    def pop_results(self) -> List[dict]:
+        return self._pop(failed=False)
+
+    def pop_failures(self) -> List[dict]:
+        return self._pop(failed=True)
+
+    def collected(self, task_id: str) -> Optional[dict]:
+        for name in [task_id, '_failed_' + task_id]:
+            try:
+                return self.read('collected', name)
+            except FileNotFoundError:
+                continue
+        return None
+
+
+# operations of the QueueBackend interface callable through a QueueServer
+QUEUE_OPERATIONS = ['put_scenario', 'get_scenario', 'submit', 'claim', 'complete', 'fail',
+                    'pop_results', 'pop_failures', 'collected']
+
+
+class QueueServer:
+    """
+    Local TCP server exposing a MemoryBackend to remote workers, with one JSON line per call
+    """
+
+    def __init__(self, backend: MemoryBackend = None, host: str = '127.0.0.1', port: int = 8767) -> None:
+        """
+        Constructor method
+        Params:
+            - backend (MemoryBackend): queues served. A new one is created if None.
+            - host (str): address of the server
+            - port (int): port of the server. Use 0 to pick a free one.
+        """
+
+        self.backend = backend or MemoryBackend()
+        backend = self.backend
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        if not isinstance(request, dict) or request.get('op') not in QUEUE_OPERATIONS:
+                            raise DistributedException(f"Unknown operation in {line[:100]!r}")
+                        value = getattr(backend, request['op'])(*request.get('args', []))
+                        response = {'ok': True, 'value': value}
+                    except Exception as error:
+                        response = {'ok': False, 'error': f"{type(error).__name__}: {error}"}
+                    self.wfile.write(json.dumps(response).encode() + b'\n')
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'QueueServer':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TCPBackend(QueueBackend):
+    """
+    Client of a QueueServer
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8767) -> None:
+        self.connection = socket.create_connection((host, port))
+        self.file = self.connection.makefile('rwb')
+        self.lock = threading.Lock()
+
+    def call(self, op: str, *args):
+        with self.lock:
+            self.file.write(json.dumps({'op': op, 'args': args}).encode() + b'\n')
+            self.file.flush()
+            response = json.loads(self.file.readline())
+
+        if not response['ok']:
+            raise DistributedException(response['error'])
+        return response['value']
+
+    def put_scenario(self, scenario_id, scenario):
+        return self.call('put_scenario', scenario_id, scenario)
+
+    def get_scenario(self, scenario_id):
+        return self.call('get_scenario', scenario_id)
+
+    def submit(self, task):
+        return self.call('submit', task)
+
+    def claim(self, worker_id, lease_seconds):
+        return self.call('claim', worker_id, lease_seconds)
+
+    def complete(self, task_id, result):
+        return self.call('complete', task_id, result)
+
+    def fail(self, task_id, error):
+        return self.call('fail', task_id, error)
+
+    def pop_results(self):
+        return self.call('pop_results')
+
+    def pop_failures(self):
+        return self.call('pop_failures')
+
+    def collected(self, task_id):
+        return self.call('collected', task_id)
+
+    def close(self):
+        self.file.close()
+        self.connection.close()
+
+
+class ReplicationAggregator:
+    """
+    Streaming statistics of the delivered tonnage per scenario, updated one result at a time.
+    The two runs of an antithetic pair are averaged into one observation once both arrived.
+    """
+
+    def __init__(self) -> None:
+        self.count: Dict[str, int] = {}
+        self.mean: Dict[str, float] = {}
+        self.m2: Dict[str, float] = {}
+        self.failures: Dict[str, int] = {}
+        self.halves: Dict[tuple, float] = {}   # first run of the antithetic pairs still open
+
+    def add(self, result: dict):
+        tons = result['tons']
+
+        if result.get('paired'):
+            key = (result['scenario_id'], result['seed'])
+            if key not in self.halves:
+                self.halves[key] = tons
+                return
+            tons = (tons + self.halves.pop(key))/2
+
+        self.add_observation(result['scenario_id'], tons)
+
+    def add_observation(self, scenario_id: str, tons: float):
+        n = self.count.get(scenario_id, 0) + 1
+        mean = self.mean.get(scenario_id, 0.0)
+        delta = tons - mean
+        mean += delta/n
+
+        self.count[scenario_id] = n
+        self.mean[scenario_id] = mean
+        self.m2[scenario_id] = self.m2.get(scenario_id, 0.0) + delta*(tons - mean)
+
+    def add_failure(self, task: dict):
+        self.failures[task['scenario_id']] = self.failures.get(task['scenario_id'], 0) + 1
+
+    def summary(self) -> Dict[str, dict]:
+        summary = {}
+        for scenario_id in {**self.count, **self.failures}:
+            n = self.count.get(scenario_id, 0)
+            variance = self.m2[scenario_id]/(n - 1) if n > 1 else 0.0
+            summary[scenario_id] = {'replications': n, 'mean_tons': self.mean.get(scenario_id, 0.0),
+                                    'std_tons': math.sqrt(variance),
+                                    'failures': self.failures.get(scenario_id, 0)}
+        return summary
+
+
+class Coordinator:
+    """
+    Shard scenario x seed tasks through a queue backend and aggregate the results as they arrive
+    """
+
+    def __init__(self, backend: QueueBackend, max_attempts: int = 3) -> None:
+        """
+        Constructor method
+        Params:
+            - backend (QueueBackend): queues shared with the workers
+            - max_attempts (int): maximum number of runs of a failing task
+        """
+
+        self.backend = backend
+        self.max_attempts = max_attempts
+        self.expected = set()
+        self.seen = set()
+        self.recovered = list()   # results and failures popped by an earlier coordinator
+
+    def submit(self, scenarios: Dict[str, dict], seeds: Iterable[int], antithetic: bool = False) -> int:
+        """
+        Queue one task per scenario and seed. All scenarios use the same seeds, so they share random numbers.
+        Params:
+            - antithetic (bool): flag to queue also the antithetic run of each seed, averaged with it
+        Return: number of new tasks
+        """
+
+        seeds = list(seeds)
+        submitted = 0
+        runs = [False, True] if antithetic else [False]
+
+        for scenario_id, scenario in scenarios.items():
+            self.backend.put_scenario(scenario_id, scenario)
+            for seed in seeds:
+                for mirrored in runs:
+                    task = {'id': task_id_for(scenario_id, seed, mirrored), 'scenario_id': scenario_id,
+                            'seed': seed, 'antithetic': mirrored, 'paired': antithetic,
+                            'attempts': 0, 'max_attempts': self.max_attempts}
+                    self.expected.add(task['id'])
+                    if self.backend.submit(task):
+                        submitted += 1
+                    elif task['id'] not in self.seen:
+                        record = self.backend.collected(task['id'])
+                        if record is not None:
+                            self.recovered.append(record)
+
+        return submitted
+
+    def collect(self, aggregator: ReplicationAggregator = None, poll_interval: float = 0.5,
+                timeout: float = None) -> ReplicationAggregator:
+        """
+        Stream the results into the aggregator until every task finished or failed
+        """
+
+        aggregator = aggregator or ReplicationAggregator()
+        deadline = None if timeout is None else clock.time() + timeout
+
+        recovered, self.recovered = self.recovered, list()
+        for record in recovered:
+            if 'task_id' in record:
+                self._add_result(aggregator, record)
+            else:
+                self._add_failure(aggregator, record)
+
+        while not self.expected <= self.seen:
+            got_any = False
+            for result in self.backend.pop_results():
+                self._add_result(aggregator, result)
+                got_any = True
+            for task in self.backend.pop_failures():
+                self._add_failure(aggregator, task)
+                got_any = True
+
+            if deadline is not None and clock.time() > deadline:
+                raise DistributedException(f"{len(self.expected - self.seen)} tasks did not finish in time")
+            if not got_any:
+                clock.sleep(poll_interval)
+
+        return aggregator
+
+    def _add_result(self, aggregator: ReplicationAggregator, result: dict):
+        if result['task_id'] not in self.seen:
+            self.seen.add(result['task_id'])
+            aggregator.add(result)
+
+    def _add_failure(self, aggregator: ReplicationAggregator, task: dict):
+        if task['id'] not in self.seen:
+            self.seen.add(task['id'])
+            aggregator.add_failure(task)
+
+
+class Worker:
+    """
+    Claim tasks from a queue backend, run them and send back compact results
+    """
+
+    def __init__(self, backend: QueueBackend, worker_id: str = None, lease_seconds: float = 600,
+                 cache: ResultCache = None) -> None:
+        """
+        Constructor method
+        Params:
+            - backend (QueueBackend): queues shared with the coordinator
+            - worker_id (str): id of the worker
+            - lease_seconds (float): time after which a claimed task is given to another worker
+            - cache (ResultCache): cache of results on the disk of the worker
+        """
+
+        self.backend = backend
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.cache = cache
+        self.scenarios: Dict[str, dict] = {}
+
+    def run(self, max_tasks: int = None, idle_timeout: float = 5, poll_interval: float = 0.5) -> int:
+        """
+        Run tasks until max_tasks are done or no task arrives during idle_timeout seconds
+        Return: number of tasks run
+        """
+
+        done = 0
+        idle_since = clock.time()
+
+        while max_tasks is None or done < max_tasks:
+            task = self.backend.claim(self.worker_id, self.lease_seconds)
+
+            if task is None:
+                if idle_timeout is not None and clock.time() - idle_since > idle_timeout:
+                    break
+                clock.sleep(poll_interval)
+                continue
+
+            if task['scenario_id'] not in self.scenarios:
+                self.scenarios[task['scenario_id']] = self.backend.get_scenario(task['scenario_id'])
+
+            try:
+                result = run_task(task, self.scenarios[task['scenario_id']], cache=self.cache)
+            except Exception:
+                self.backend.fail(task['id'], traceback.format_exc(limit=3))
+            else:
+                self.backend.complete(task['id'], result)
+
+            done += 1
+            idle_since = clock.time()
+
+        return done
+
+
+class DistributedException(Exception):
+    pass
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Worker of distributed replications")
+    parser.add_argument('--root', help="directory of a FileSystemBackend")
+    parser.add_argument('--host', default='127.0.0.1', help="host of a QueueServer")
+    parser.add_argument('--port', type=int, default=8767, help="port of a QueueServer")
+    parser.add_argument('--cache', help="folder of a cache of results")
+    parser.add_argument('--idle-timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    backend = FileSystemBackend(args.root) if args.root else TCPBackend(args.host, args.port)
+    cache = ResultCache(args.cache) if args.cache else None
+    Worker(backend, cache=cache).run(idle_timeout=args.idle_timeout)
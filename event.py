@@ -4,6 +4,16 @@ from demand import Demand
 from train import Train
 from terminal import Terminal
 
+EVENT_TYPES = frozenset(['dispatch', 'arrival', 'unload', 'load'])
+
+# descriptions of the events scheduled by the simulation, formatted only when the log is read
+DESCRIPTIONS = {
+    'arrival': 'Train {train} arrived at Terminal {terminal}',
+    'unload': 'Train {train} is unloading carg at Terminal {terminal}',
+    'load': 'Train {train} is loading carg at Terminal {terminal}',
+    'dispatch': 'Train {train} is going from Terminal {terminal} to Terminal {destination}',
+}
+
 class Event:
     """
     Model a event of the simulation
@@ -14,46 +24,79 @@ class Event:
         """
         Constructor method
         Params:
-            - description (str): description of the event
+            - description (str): description of the event. If None, it is built from the type when read.
             - callback: function to be called when event starts
             - train: train
             - terminal: terminal
             - demand: demand
         """
 
-        if type.lower() not in ['dispatch', 'arrival', 'unload', 'load']:
+        self.reset(begin=begin, end=end, type=type, description=description,
+                   train=train, terminal=terminal, demand=demand)
+
+    def reset(self, begin: int, end: int, type: str, description: str = None,
+              train: Train = None, terminal: Terminal = None, demand: Demand = None):
+        """
+        Set all the attributes of the event, so a released event can be reused
+        """
+
+        if type not in EVENT_TYPES and type.lower() not in EVENT_TYPES:
             raise EventException(f"{type} is not a valid type of event")
 
         self.begin = begin
         self.end = end
-        self.description = description
+        self._description = description
         self.type = type
         self.train = train
         self.terminal = terminal
         self.demand = demand
 
         self.destination_terminal: Optional[Terminal] = None
+        self.reserved_room: float = 0     # room reserved in the stock timeline of the terminal by a unload
+        self.reserved_track = False       # flag if a dispatch reserved a track segment
 
-        if self.description is not None:
-            self.log_message = "On " + self.convert_minutes_to_date(minutes=self.begin)[0] + "---> " + self.description
-        else:
-            self.log_message = "On " + self.convert_minutes_to_date(minutes=self.begin)[0] + "---> " + f"Event {self.type}"
- 
+    @property
+    def description(self) -> Optional[str]:
+        if self._description is not None:
+            return self._description
+
+        if self.train is None or self.terminal is None or self.type not in DESCRIPTIONS:
+            return None
+        if self.type == 'dispatch' and self.destination_terminal is None:
+            return None
+
+        return DESCRIPTIONS[self.type].format(
+            train=self.train.id, terminal=self.terminal.id,
+            destination=None if self.destination_terminal is None else self.destination_terminal.id)
+
+    @description.setter
+    def description(self, description: str):
+        self._description = description
+
+    @property
+    def log_message(self) -> str:
+        description = self.description
+        if description is None:
+            description = f"Event {self.type}"
+
+        return "On " + self.convert_minutes_to_date(minutes=self.begin)[0] + "---> " + description
 
 
     def load_train_in_terminal(self):
         demand = self.terminal.load_train_in_terminal(train=self.train, 
                                             destination=self.destination_terminal.id,
-                                            current_time=self.begin)
+                                            current_time=self.begin,
+                                            end_time=self.end)
         self.demand = demand
 
     def unload_train_in_terminal(self):
-        self.terminal.unload_train_in_terminal(train=self.train, current_time=self.begin)
+        self.terminal.unload_train_in_terminal(train=self.train, current_time=self.begin, end_time=self.end)
 
     def dispatch_train_from_terminal(self):
         self.terminal.dispatch_train(train=self.train,
                                     destination=self.destination_terminal.id,
-                                    current_time=self.begin)
+                                    current_time=self.begin,
+                                    arrival_time=self.end)
     
     def train_arrives_at_terminal(self):
         self.terminal.register_train_arrival(train=self.train, current_time=self.begin)
@@ -63,6 +106,13 @@ class Event:
     def callback(self):
 
         print(self.log_message)
+        self.apply()
+
+    def apply(self):
+        """
+        Apply the effects of the event on its train and terminal
+        """
+
         if self.type == 'load':
             self.load_train_in_terminal()
         elif self.type == 'unload':
@@ -108,11 +158,54 @@ class Event:
             'end_hour': self.convert_minutes_to_date(self.begin)[2],
             'train': self.train.id,
             'terminal': self.terminal.id,
+            'tons': self.demand.total if self.demand is not None else 0,
 
         }
 
         return info
 
+    @property
+    def compact_info(self):
+        """
+        Info of the event without the dates formatted as text. Used in the hot-path mode of the schedule;
+        the dates are formatted only when the log sheet is built.
+        """
+
+        return {
+            'type': self.type,
+            'begin': self.begin,
+            'end': self.end,
+            'train': self.train.id,
+            'terminal': self.terminal.id,
+            'tons': self.demand.total if self.demand is not None else 0,
+        }
+
+
+class EventPool:
+    """
+    Pool of released events, reused by the schedule instead of allocating new ones
+    """
+
+    def __init__(self) -> None:
+        self.free = list()
+
+    def acquire(self, begin: int, end: int, type: str, description: str = None,
+                train: Train = None, terminal: Terminal = None, demand: Demand = None) -> Event:
+
+        if self.free:
+            event = self.free.pop()
+            event.reset(begin=begin, end=end, type=type, description=description,
+                        train=train, terminal=terminal, demand=demand)
+            return event
+
+        return Event(begin=begin, end=end, type=type, description=description,
+                     train=train, terminal=terminal, demand=demand)
+
+    def release(self, event: Event):
+        # drop the references, so the pool does not keep trains, terminals and demands alive
+        event.train = event.terminal = event.demand = event.destination_terminal = None
+        self.free.append(event)
+
 
 class EventException(Exception):
     pass
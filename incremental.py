@@ -0,0 +1,259 @@
+from copy import deepcopy
+from typing import List
+import numpy as np
+
+from replay import EVENT_TYPES, DecisionRecorder, ReplayEngine
+from scenario import build_simulator, build_train
+from simulator import Simulator
+from streams import build_stream
+
+
+class TerminalEdit:
+    """
+    Change of the parameters of a terminal, like load_time or unload_time
+    """
+
+    def __init__(self, terminal_id: str, **changes) -> None:
+        """
+        Constructor method
+        Params:
+            - terminal_id (str): id of the terminal
+            - changes: new values of the attributes of the terminal
+        """
+
+        self.terminal_id = terminal_id
+        self.changes = changes
+
+    def first_affected_event(self, incremental: 'IncrementalSimulator') -> int:
+        return min([incremental.first_event_reading_terminal(self.terminal_id, attribute)
+                    for attribute in self.changes], default=len(incremental.engine))
+
+    def apply_to_scenario(self, scenario: dict) -> bool:
+        return _update_entry(scenario['terminals'], self.terminal_id, self.changes)
+
+    def apply(self, simulator: Simulator):
+        terminal = simulator.get_terminal_from_id(terminal_id=self.terminal_id)
+        if terminal is None:
+            raise IncrementalException(f"Terminal {self.terminal_id} does not exist")
+        if 'max_capacity' in self.changes:
+            terminal.capacity += self.changes['max_capacity'] - terminal.max_capacity
+        for attribute, value in self.changes.items():
+            setattr(terminal, attribute, value)
+
+
+class TrainEdit:
+    """
+    Change of the parameters of a train, like its velocities
+    """
+
+    def __init__(self, train_id: str, **changes) -> None:
+        """
+        Constructor method
+        Params:
+            - train_id (str): id of the train
+            - changes: new values of the attributes of the train
+        """
+
+        self.train_id = train_id
+        self.changes = changes
+
+    def first_affected_event(self, incremental: 'IncrementalSimulator') -> int:
+        return min([incremental.first_event_reading_train(self.train_id, attribute)
+                    for attribute in self.changes], default=len(incremental.engine))
+
+    def apply_to_scenario(self, scenario: dict) -> bool:
+        return _update_entry(scenario['trains'], self.train_id, self.changes)
+
+    def apply(self, simulator: Simulator):
+        train = next((train for train in simulator.trains if train.id == self.train_id), None)
+        if train is None:
+            raise IncrementalException(f"Train {self.train_id} does not exist")
+        for attribute, value in self.changes.items():
+            setattr(train, attribute, value)
+
+
+class AddTrain:
+    """
+    New empty train entering the simulation at a given instant
+    """
+
+    def __init__(self, train: dict, location: str, destination: str, time: int) -> None:
+        """
+        Constructor method
+        Params:
+            - train (dict): parameters of the train, as in the scenario
+            - location (str): id of the terminal where the train starts
+            - destination (str): id of its first destination
+            - time (int): instant the train becomes available, in minutes
+        """
+
+        self.train = train
+        self.location = location
+        self.destination = destination
+        self.time = time
+
+    def first_affected_event(self, incremental: 'IncrementalSimulator') -> int:
+        return incremental.first_event_after(self.time)
+
+    def apply_to_scenario(self, scenario: dict) -> bool:
+        return False
+
+    def apply(self, simulator: Simulator):
+        simulator.add_train(train=build_train(self.train), location=self.location,
+                            destination=self.destination, time=max(self.time, simulator.time))
+
+
+class IncrementalSimulator:
+    """
+    Run a base scenario once and answer what-if edits by resimulating only from the
+    first event that reads an edited parameter:
+        - load_time and unload_time of a terminal: a load or unload at the terminal is built
+          when the previous event of its train is called
+        - max_capacity of a terminal: the room is checked when an unload at the terminal is built,
+          when a train leaves a neighbour terminal with demand and when supply arrives at the terminal
+        - velocities of a train: its travel times are computed when its events are called,
+          and for the dispatches scheduled when the simulation starts
+    Other parameters are read when the simulation starts, so editing them runs it again from the beginning.
+    """
+
+    def __init__(self, scenario: dict, snapshot_interval: int = 200) -> None:
+        """
+        Constructor method
+        Params:
+            - scenario (dict): base scenario, as accepted by scenario.build_simulator
+            - snapshot_interval (int): number of events between two snapshots of the base run
+        """
+
+        self.scenario = scenario
+
+        self.base = build_simulator(scenario, log=False)
+        recorder = DecisionRecorder(self.base, snapshot_interval=snapshot_interval)
+        self.base.simulate(output_path=None)
+
+        self.engine = ReplayEngine.from_recorder(recorder)
+
+        records = self.engine.records_array
+        self.begins = records['begin']
+        total = len(records)
+
+        # the call of an event builds the next event of its train. The first events of the trains
+        # were built when the simulation started, before the first call.
+        self.first_call = {train_id: total for train_id in self.engine.train_ids}
+        self.first_build = {}   # (type, terminal id) -> first call building a load or unload at the terminal
+        last_call = {}
+
+        for index, (type_code, train, terminal) in enumerate(zip(records['type'].tolist(), records['train'].tolist(),
+                                                                  records['terminal'].tolist())):
+            train_id = self.engine.train_ids[train]
+            self.first_call[train_id] = min(self.first_call[train_id], index)
+            self._built(EVENT_TYPES[type_code], self.engine.terminal_ids[terminal], last_call.get(train_id, 0))
+            last_call[train_id] = index
+
+        # events still scheduled at the end of the base run could move into the horizon with the edits
+        for event in self.base.scheduler.events:
+            self._built(event.type, event.terminal.id, last_call.get(event.train.id, 0))
+
+        initial = self.engine.state_at(0)
+        self.initial_dispatch = {event.train.id for event in initial.scheduler.events
+                                 if event.type in ('dispatch', 'arrival')}
+        self.initial_trains = {event.train.id for event in initial.scheduler.events}
+
+        self.first_room_check = {}
+        for terminal_id in self.engine.terminal_ids:
+            # trains leaving a neighbour with demand only go to terminals with room
+            neighbours = [i for i, other in enumerate(self.engine.terminal_ids)
+                          if terminal_id in scenario['terminals_graph'].get(other, {})
+                          and initial.get_terminal_from_id(terminal_id=other).has_demand]
+            checks = [self.first_build.get(('unload', terminal_id), total),
+                      _first_index(np.isin(records['terminal'], neighbours), total)]
+            checks += [self.first_event_after(stream.next_time) for stream in map(build_stream, scenario.get('streams', []))
+                       if stream.type == 'supply' and stream.terminal == terminal_id and stream.next_time is not None]
+            self.first_room_check[terminal_id] = min(checks)
+
+    def _built(self, type: str, terminal_id: str, call: int):
+        if type in ('load', 'unload'):
+            key = (type, terminal_id)
+            self.first_build[key] = min(self.first_build.get(key, call), call)
+
+    def first_event_reading_terminal(self, terminal_id: str, attribute: str) -> int:
+        if terminal_id not in self.first_room_check:
+            raise IncrementalException(f"Terminal {terminal_id} does not exist")
+
+        if attribute == 'load_time':
+            return self.first_build.get(('load', terminal_id), len(self.engine))
+        if attribute == 'unload_time':
+            return self.first_build.get(('unload', terminal_id), len(self.engine))
+        if attribute == 'max_capacity':
+            return self.first_room_check[terminal_id]
+        return 0
+
+    def first_event_reading_train(self, train_id: str, attribute: str) -> int:
+        if train_id not in self.first_call:
+            raise IncrementalException(f"Train {train_id} does not exist")
+
+        if attribute in ('velocity_empty', 'velocity_full'):
+            return 0 if train_id in self.initial_dispatch else self.first_call[train_id]
+        if attribute == 'max_capacity':
+            # the demand of the first load is built when the simulation starts
+            return 0 if train_id in self.initial_trains else self.first_call[train_id]
+        return 0
+
+    def first_event_after(self, time: int) -> int:
+        return _first_index(self.begins >= time, len(self.begins))
+
+    def fork_point(self, edits: List) -> int:
+        """
+        Returns: number of events of the base run not affected by the edits
+        """
+
+        return min([edit.first_affected_event(self) for edit in edits], default=len(self.engine))
+
+    def rerun(self, edits: List, output_path: str = None) -> Simulator:
+        """
+        Resimulate the scenario with the edits, reusing the events of the base run before the fork point
+        Params:
+            - edits (list): list of TerminalEdit, TrainEdit and AddTrain
+            - output_path (str): path of the sheet with the summary of the simulation. If None, no sheet is written.
+        Return: simulator at the end of the edited run
+        """
+
+        fork = self.fork_point(edits)
+
+        if fork == 0:
+            # nothing to reuse: the edits also change how the initial events are built
+            scenario = deepcopy(self.scenario)
+            edits = [edit for edit in edits if not edit.apply_to_scenario(scenario)]
+            simulator = build_simulator(scenario, log=False)
+            simulator.initiate_simulation()
+        else:
+            simulator = self.engine.fork_at(fork)
+
+        for edit in edits:
+            edit.apply(simulator)
+
+        simulator.run()
+        simulator.finish(output_path=output_path)
+
+        return simulator
+
+
+def _update_entry(entries: List[dict], entry_id: str, changes: dict) -> bool:
+    """
+    Update the parameters of the entry of the scenario with the given id
+    """
+
+    entry = next((entry for entry in entries if entry['id'] == entry_id), None)
+    if entry is None:
+        raise IncrementalException(f"{entry_id} does not exist in the scenario")
+    entry.update(changes)
+
+    return True
+
+
+def _first_index(mask: np.ndarray, default: int) -> int:
+    index = int(np.argmax(mask))
+    return index if mask.size > 0 and mask[index] else default
+
+
+class IncrementalException(Exception):
+    pass
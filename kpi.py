@@ -0,0 +1,197 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+from schedule import Schedule
+
+MINUTES_PER_DAY = 24*60
+
+LOG_COLUMNS = ['type', 'begin', 'end', 'train', 'terminal', 'tons']
+
+
+def build_log_frame(events_log: List[dict]) -> pd.DataFrame:
+    """
+    Build a columnar copy of a events log
+    Params:
+        - events_log (list): list of event infos, as stored in Schedule.events_log
+    """
+
+    columns = {col: [info[col] for info in events_log] for col in LOG_COLUMNS}
+
+    return pd.DataFrame(columns, columns=LOG_COLUMNS)
+
+
+def build_replications_frame(logs: List[List[dict]]) -> pd.DataFrame:
+    """
+    Build a single columnar frame from several events logs, with a column 'replication'
+    identifying the log each row came from.
+    """
+
+    columns = {col: [info[col] for log in logs for info in log] for col in LOG_COLUMNS}
+    columns['replication'] = np.repeat(np.arange(len(logs)), [len(log) for log in logs])
+
+    return pd.DataFrame(columns, columns=['replication'] + LOG_COLUMNS)
+
+
+def _keys(df: pd.DataFrame, key: str) -> list:
+    return ['replication', key] if 'replication' in df.columns else [key]
+
+
+def _with_gaps(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sort the events of each train and compute the gap between the end of the previous
+    event of the same train and the begin of the current one.
+    """
+
+    keys = _keys(df, 'train')
+    df = df.sort_values(keys + ['begin'], kind='mergesort')
+    prev_end = df.groupby(keys, sort=False)['end'].shift()
+    prev_type = df.groupby(keys, sort=False)['type'].shift()
+
+    return df.assign(gap=(df['begin'] - prev_end).clip(lower=0).fillna(0),
+                     prev_type=prev_type)
+
+
+def cycle_times(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mean time, in minutes, between two consecutive loads of the same train
+    """
+
+    keys = _keys(df, 'train')
+    loads = df[df['type'] == 'load'].sort_values(keys + ['begin'], kind='mergesort')
+    cycle = loads.groupby(keys, sort=False)['begin'].diff()
+
+    result = loads.assign(cycle_time=cycle).groupby(keys)['cycle_time'].agg(['mean', 'count'])
+
+    return result.rename(columns={'mean': 'cycle_time', 'count': 'cycles'})
+
+
+def terminal_utilization(df: pd.DataFrame, horizon: int) -> pd.DataFrame:
+    """
+    Fraction of the horizon each terminal spent loading or unloading trains
+    """
+
+    keys = _keys(df, 'terminal')
+    operations = df[df['type'].isin(['load', 'unload'])]
+    busy = (operations['end'] - operations['begin']).groupby([operations[k] for k in keys]).sum()
+
+    return (busy/horizon).rename('utilization').to_frame()
+
+
+def train_idle_time(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Total time, in minutes, each train waited between the end of a event and the begin of the next one
+    """
+
+    df = _with_gaps(df)
+
+    return df.groupby(_keys(df, 'train'))['gap'].sum().rename('idle_time').to_frame()
+
+
+def queue_waits(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Waiting time of trains in the queue of each terminal before a load or unload starts
+    """
+
+    df = _with_gaps(df)
+    queued = df[df['type'].isin(['load', 'unload']) & df['prev_type'].notna()]
+
+    waits = queued.groupby(_keys(df, 'terminal') + ['type'])['gap'].agg(['mean', 'max', 'count'])
+
+    return waits.rename(columns={'mean': 'mean_wait', 'max': 'max_wait', 'count': 'operations'})
+
+
+def tons_per_day(df: pd.DataFrame, horizon: int) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Loaded tons per day of simulation
+    Return: tuple with the mean tons per day and the tons loaded in each day
+    """
+
+    loads = df[df['type'] == 'load']
+    keys = ['replication'] if 'replication' in df.columns else []
+    day = (loads['begin'] // MINUTES_PER_DAY).rename('day')
+
+    daily = loads['tons'].groupby([loads[k] for k in keys] + [day]).sum()
+
+    days = max(1, int(np.ceil(horizon/MINUTES_PER_DAY)))
+
+    if keys:
+        totals = loads.groupby(keys)['tons'].sum()
+    else:
+        totals = pd.Series({'total': loads['tons'].sum()})
+
+    return (totals/days).rename('tons_per_day').to_frame(), daily.rename('tons').to_frame()
+
+
+def compute_kpis(df: pd.DataFrame, horizon: int) -> Dict[str, pd.DataFrame]:
+    """
+    Compute all the KPIs of a columnar events log
+    Params:
+        - df (DataFrame): frame built by build_log_frame or build_replications_frame
+        - horizon (int): time horizon of the simulation, in minutes
+    """
+
+    mean_tons, daily_tons = tons_per_day(df, horizon)
+
+    return {
+        'cycle_times': cycle_times(df),
+        'terminal_utilization': terminal_utilization(df, horizon),
+        'train_idle_time': train_idle_time(df),
+        'queue_waits': queue_waits(df),
+        'tons_per_day': mean_tons,
+        'daily_tons': daily_tons,
+    }
+
+
+def compute_replications_kpis(logs: List[List[dict]], horizon: int) -> Dict[str, pd.DataFrame]:
+    """
+    Compute the KPIs of several replications at once, indexed by replication
+    """
+
+    return compute_kpis(build_replications_frame(logs), horizon)
+
+
+class KPIEngine:
+    """
+    Incremental KPI engine, fed by the events logged by a schedule
+    """
+
+    def __init__(self, horizon: int, schedule: Optional[Schedule] = None) -> None:
+        """
+        Constructor method
+        Params:
+            - horizon (int): time horizon of the simulation, in minutes
+            - schedule (Schedule): schedule to listen to. Every logged event is added to the engine.
+        """
+
+        self.horizon = horizon
+        self.columns = {col: list() for col in LOG_COLUMNS}
+        self._kpis = None   # cached result, invalidated when a new event arrives
+
+        if schedule is not None:
+            self.attach(schedule)
+
+    def attach(self, schedule: Schedule):
+        for info in schedule.events_log:
+            self.update(info)
+        schedule.log_listeners.append(self.update)
+
+    def update(self, info: dict):
+        for col in LOG_COLUMNS:
+            self.columns[col].append(info[col])
+        self._kpis = None
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columns, columns=LOG_COLUMNS)
+
+    def compute(self) -> Dict[str, pd.DataFrame]:
+        if self._kpis is None:
+            self._kpis = compute_kpis(self.frame, self.horizon)
+        return self._kpis
+
+    def print_kpis(self):
+        kpis = self.compute()
+        for name in ['cycle_times', 'terminal_utilization', 'train_idle_time', 'queue_waits', 'tons_per_day']:
+            print(name)
+            print(kpis[name])
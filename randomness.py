@@ -0,0 +1,109 @@
+import math
+import zlib
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+BLOCK = 256   # uniforms drawn at once per stream
+
+
+class RandomStreams:
+    """
+    Common random numbers: one stream of uniforms per train and per terminal and per use,
+    derived from the seed and the id of the entity. Two scenarios run with the same seed consume
+    the same numbers for the entities they share, whatever other trains or terminals they have.
+    """
+
+    def __init__(self, seed: int, antithetic: bool = False) -> None:
+        """
+        Constructor method
+        Params:
+            - seed (int): seed of the replication
+            - antithetic (bool): flag to use 1 - u instead of each uniform u, mirroring the run with the same seed
+        """
+
+        self.seed = seed
+        self.antithetic = antithetic
+        self.generators: Dict[str, np.random.Generator] = {}
+        self.blocks: Dict[str, np.ndarray] = {}
+        self.cursors: Dict[str, int] = {}
+
+    def uniform(self, kind: str, entity_id: str, use: str) -> float:
+        key = f"{kind}:{entity_id}:{use}"
+
+        cursor = self.cursors.get(key, BLOCK)
+        if cursor == BLOCK:
+            generator = self.generators.get(key)
+            if generator is None:
+                sequence = np.random.SeedSequence(entropy=self.seed, spawn_key=(zlib.crc32(key.encode()),))
+                generator = self.generators[key] = np.random.Generator(np.random.PCG64(sequence))
+            self.blocks[key] = generator.random(BLOCK)
+            cursor = 0
+
+        u = float(self.blocks[key][cursor])
+        self.cursors[key] = cursor + 1
+
+        return 1.0 - u if self.antithetic else u
+
+
+def triangular(u: float, low: float, mode: float, high: float) -> float:
+    """
+    Returns: value of the triangular distribution at the quantile u (inverse transform)
+    """
+
+    if high <= low:
+        return mode
+    split = (mode - low)/(high - low)
+    if u < split:
+        return low + math.sqrt(u*(high - low)*(mode - low))
+    return high - math.sqrt((1 - u)*(high - low)*(high - mode))
+
+
+class DurationNoise:
+    """
+    Random durations of the operations, as triangular factors of their nominal durations.
+    Travel times use the stream of the train, load and unload times the stream of the terminal.
+    """
+
+    def __init__(self, streams: RandomStreams, travel: Optional[Sequence[float]] = None,
+                 load: Optional[Sequence[float]] = None, unload: Optional[Sequence[float]] = None) -> None:
+        """
+        Constructor method
+        Params:
+            - streams (RandomStreams): random numbers of the replication
+            - travel, load, unload (tuple): factors (low, mode, high) applied to the nominal duration.
+                None keeps the duration fixed.
+        """
+
+        self.streams = streams
+        self.factors: Dict[str, Optional[Tuple[float, float, float]]] = {
+            'dispatch': None if travel is None else tuple(travel),
+            'load': None if load is None else tuple(load),
+            'unload': None if unload is None else tuple(unload),
+        }
+
+    def duration(self, type: str, train, terminal, nominal: int) -> int:
+        """
+        Returns: duration, in minutes, of an operation of the given type
+        """
+
+        factors = self.factors[type]
+        if factors is None:
+            return nominal
+
+        if type == 'dispatch':
+            u = self.streams.uniform('train', train.id, type)
+        else:
+            u = self.streams.uniform('terminal', terminal.id, type)
+
+        return max(0, int(round(nominal*triangular(u, *factors))))
+
+
+def build_durations(info: dict, seed: int, antithetic: bool = False) -> DurationNoise:
+    """
+    Build the random durations of a scenario:
+        {'travel': [low, mode, high], 'load': [low, mode, high], 'unload': [low, mode, high]}
+    """
+
+    return DurationNoise(streams=RandomStreams(seed=seed, antithetic=antithetic),
+                         travel=info.get('travel'), load=info.get('load'), unload=info.get('unload'))
@@ -0,0 +1,236 @@
+import pickle
+from bisect import bisect_right
+import struct
+import zlib
+from typing import Dict, List, Optional
+import numpy as np
+from event import Event
+from simulator import Simulator
+from terminal import Terminal
+
+MAGIC = b'TRRP'
+VERSION = 1
+
+EVENT_TYPES = ['dispatch', 'arrival', 'unload', 'load']
+
+NO_TERMINAL = 0xFFFF
+
+# begin, end, type, train, terminal, destination of the event, chosen next destination
+RECORD = struct.Struct('<iiBHHHH')
+RECORD_DTYPE = np.dtype([('begin', '<i4'), ('end', '<i4'), ('type', 'u1'), ('train', '<u2'),
+                         ('terminal', '<u2'), ('destination', '<u2'), ('next_destination', '<u2')])
+HEADER = struct.Struct('<4sHIII')   # magic, version, snapshot interval, number of records, number of snapshots
+CHUNK = struct.Struct('<II')        # index of the event, size of the snapshot
+
+
+class DecisionRecorder:
+    """
+    Record the stream of events popped by a simulator and the destinations chosen for them,
+    with periodic snapshots of the state of the simulation.
+    """
+
+    def __init__(self, simulator: Simulator, snapshot_interval: int = 500) -> None:
+        """
+        Constructor method
+        Params:
+            - simulator (Simulator): simulator to record. Must be attached before simulate() is called.
+            - snapshot_interval (int): number of events between two snapshots of the state
+        """
+
+        if snapshot_interval <= 0:
+            raise ReplayException("snapshot_interval must be positive")
+
+        self.simulator = simulator
+        self.snapshot_interval = snapshot_interval
+        self.train_ids = [train.id for train in simulator.trains]
+        self.terminal_ids = [terminal.id for terminal in simulator.termimals]
+
+        self._train_index = {train_id: i for i, train_id in enumerate(self.train_ids)}
+        self._terminal_index = {terminal_id: i for i, terminal_id in enumerate(self.terminal_ids)}
+
+        self.records = bytearray()
+        self.snapshots: Dict[int, bytes] = {}
+        self.total_records = 0
+
+        simulator.step_listeners.append(self.record)
+
+    def terminal_index(self, terminal: Optional[Terminal]):
+        return NO_TERMINAL if terminal is None else self._terminal_index[terminal.id]
+
+    def record(self, event: Event, next_destination: Terminal):
+
+        if self.total_records % self.snapshot_interval == 0:
+            self.snapshots[self.total_records] = self.take_snapshot()
+
+        self.records += RECORD.pack(event.begin, event.end, EVENT_TYPES.index(event.type),
+                                    self._train_index[event.train.id],
+                                    self._terminal_index[event.terminal.id],
+                                    self.terminal_index(event.destination_terminal),
+                                    self.terminal_index(next_destination))
+        self.total_records += 1
+
+    def take_snapshot(self) -> bytes:
+        """
+        Pickle the simulator, without its step listeners
+        """
+
+        listeners = self.simulator.step_listeners
+        self.simulator.step_listeners = list()
+
+        try:
+            return zlib.compress(pickle.dumps(self.simulator, protocol=pickle.HIGHEST_PROTOCOL))
+        finally:
+            self.simulator.step_listeners = listeners
+
+    def save(self, path: str):
+        """
+        Save the recording in a binary file
+        """
+
+        ids = pickle.dumps((self.train_ids, self.terminal_ids))
+
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.snapshot_interval,
+                                   self.total_records, len(self.snapshots)))
+            file.write(struct.pack('<I', len(ids)))
+            file.write(ids)
+            file.write(self.records)
+            for index, blob in sorted(self.snapshots.items()):
+                file.write(CHUNK.pack(index, len(blob)))
+                file.write(blob)
+
+
+class ReplayEngine:
+    """
+    Rebuild the state of a simulation at any event index from a recording,
+    without recomputing the dispatch decisions.
+    """
+
+    def __init__(self, records: bytes, snapshots: Dict[int, bytes], train_ids: List[str],
+                 terminal_ids: List[str], snapshot_interval: int) -> None:
+        """
+        Constructor method
+        Params:
+            - records (bytes): packed records of the events
+            - snapshots (dict): compressed snapshots of the simulator, per event index
+            - train_ids (list): ids of the trains, in the order used by the records
+            - terminal_ids (list): ids of the terminals, in the order used by the records
+            - snapshot_interval (int): number of events between two snapshots
+        """
+
+        if 0 not in snapshots:
+            raise ReplayException("Recording has no initial snapshot")
+
+        self.records = records
+        self.snapshots = snapshots
+        self.snapshot_indexes = sorted(snapshots)
+        self.train_ids = train_ids
+        self.terminal_ids = terminal_ids
+        self.snapshot_interval = snapshot_interval
+        self.total_events = len(records)//RECORD.size
+
+        self._cursor: Optional[Simulator] = None
+        self._cursor_index = -1
+
+    @classmethod
+    def from_recorder(cls, recorder: DecisionRecorder):
+        return cls(records=bytes(recorder.records), snapshots=dict(recorder.snapshots),
+                   train_ids=recorder.train_ids, terminal_ids=recorder.terminal_ids,
+                   snapshot_interval=recorder.snapshot_interval)
+
+    @classmethod
+    def from_file(cls, path: str):
+
+        with open(path, 'rb') as file:
+            magic, version, interval, total_records, total_snapshots = HEADER.unpack(file.read(HEADER.size))
+
+            if magic != MAGIC or version != VERSION:
+                raise ReplayException(f"{path} is not a valid recording")
+
+            (size,) = struct.unpack('<I', file.read(4))
+            train_ids, terminal_ids = pickle.loads(file.read(size))
+            records = file.read(total_records*RECORD.size)
+
+            snapshots = {}
+            for _ in range(total_snapshots):
+                index, size = CHUNK.unpack(file.read(CHUNK.size))
+                snapshots[index] = file.read(size)
+
+        return cls(records=records, snapshots=snapshots, train_ids=train_ids,
+                   terminal_ids=terminal_ids, snapshot_interval=interval)
+
+    def record(self, index: int) -> dict:
+        """
+        Returns: decoded record of the event with the given index
+        """
+
+        begin, end, type_code, train, terminal, destination, next_destination = RECORD.unpack_from(
+            self.records, index*RECORD.size)
+
+        return {
+            'begin': begin,
+            'end': end,
+            'type': EVENT_TYPES[type_code],
+            'train': self.train_ids[train],
+            'terminal': self.terminal_ids[terminal],
+            'destination': None if destination == NO_TERMINAL else self.terminal_ids[destination],
+            'next_destination': None if next_destination == NO_TERMINAL else self.terminal_ids[next_destination],
+        }
+
+    @property
+    def records_array(self) -> np.ndarray:
+        """
+        Returns: records as a numpy structured array, without copy
+        """
+        return np.frombuffer(self.records, dtype=RECORD_DTYPE)
+
+    def apply_record(self, simulator: Simulator, index: int):
+        """
+        Apply the event with the given index on the simulator, using the recorded destination
+        """
+
+        record = self.record(index)
+        event: Event = simulator.scheduler.events[0]
+
+        if (event.type, event.train.id, event.begin) != (record['type'], record['train'], record['begin']):
+            raise ReplayException(f"Event {index} diverges from the recording: "
+                                  f"{event.type} of train {event.train.id} at {event.begin}")
+
+        next_destination = simulator.get_terminal_from_id(terminal_id=record['next_destination'])
+        simulator.process_event(event=event, next_destination=next_destination, log=False)
+
+    def state_at(self, index: int) -> Simulator:
+        """
+        Rebuild the state of the simulation after the first `index` events were called.
+        The returned simulator is owned by the engine and is reused by the next calls.
+        """
+
+        if index < 0 or index > self.total_events:
+            raise ReplayException(f"Event index {index} out of range [0, {self.total_events}]")
+
+        start = self.snapshot_indexes[bisect_right(self.snapshot_indexes, index) - 1]
+
+        if self._cursor is None or not start <= self._cursor_index <= index:
+            self._cursor = pickle.loads(zlib.decompress(self.snapshots[start]))
+            self._cursor_index = start
+
+        for i in range(self._cursor_index, index):
+            self.apply_record(self._cursor, i)
+
+        self._cursor_index = index
+
+        return self._cursor
+
+    def fork_at(self, index: int) -> Simulator:
+        """
+        Returns: independent copy of the state of the simulation after the first `index` events
+        """
+
+        return pickle.loads(pickle.dumps(self.state_at(index), protocol=pickle.HIGHEST_PROTOCOL))
+
+    def __len__(self):
+        return self.total_events
+
+
+class ReplayException(Exception):
+    pass
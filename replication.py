@@ -0,0 +1,180 @@
+import math
+from statistics import NormalDist
+from typing import List, Optional, Tuple
+
+from cache import ResultCache, cached_simulate, compact_result
+from scenario import build_simulator
+
+
+# above this number of degrees of freedom, the Cornish-Fisher expansion is exact to about 1e-5
+EXACT_MAX_DOF = 30
+
+
+def t_probability(t: float, dof: int) -> float:
+    """
+    Returns: probability of |T| < t for a Student t distribution with an integer number of degrees
+    of freedom, by the finite series of its distribution function
+    """
+
+    theta = math.atan(t/math.sqrt(dof))
+    cos2 = math.cos(theta)**2
+    odd = dof % 2
+
+    # sum of the powers of cos2 up to (dof - 2)/2 for an even dof, (dof - 3)/2 for an odd one
+    term = 1.0
+    total = 1.0 if dof > 1 else 0.0
+    for j in range(1, (dof - 1)//2 if odd else dof//2):
+        term *= cos2*(2*j if odd else 2*j - 1)/(2*j + 1 if odd else 2*j)
+        total += term
+
+    if odd:
+        return 2/math.pi*(theta + math.sin(theta)*math.cos(theta)*total)
+
+    return math.sin(theta)*total
+
+
+def t_quantile(confidence: float, dof: int) -> float:
+    """
+    Returns: two-sided quantile of the Student t distribution. Small numbers of degrees of freedom
+    invert the distribution function by bisection, others use the Cornish-Fisher expansion of the normal one.
+    """
+
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    if dof <= 0:
+        return math.inf
+
+    if dof <= EXACT_MAX_DOF:
+        low, high = z, 2*z
+        while t_probability(high, dof) < confidence:
+            low, high = high, 2*high
+        for _ in range(100):
+            middle = (low + high)/2
+            if t_probability(middle, dof) < confidence:
+                low = middle
+            else:
+                high = middle
+        return (low + high)/2
+
+    return (z + (z**3 + z)/(4*dof) + (5*z**5 + 16*z**3 + 3*z)/(96*dof**2)
+            + (3*z**7 + 19*z**5 + 17*z**3 - 15*z)/(384*dof**3))
+
+
+def confidence_interval(values: List[float], confidence: float = 0.95) -> Tuple[float, float]:
+    """
+    Returns: mean of the values and half width of its confidence interval
+    """
+
+    n = len(values)
+    mean = sum(values)/n
+    if n < 2:
+        return mean, math.inf
+
+    variance = sum((value - mean)**2 for value in values)/(n - 1)
+
+    return mean, t_quantile(confidence, n - 1)*math.sqrt(variance/n)
+
+
+def delivered_tons(scenario: dict, seed: int, antithetic: bool = False, cache: ResultCache = None) -> float:
+    """
+    Returns: tonnage delivered in one replication of the scenario
+    """
+
+    if cache is not None:
+        return cached_simulate(scenario, cache, seed=seed, antithetic=antithetic)['record']['tons']
+
+    simulator = build_simulator(scenario, seed=seed, antithetic=antithetic, log=False, hot_path=True)
+    simulator.simulate(output_path=None)
+
+    return compact_result(simulator)['tons']
+
+
+class SequentialReplicator:
+    """
+    Replications of the delivered tonnage of a scenario, or of its difference to another scenario,
+    run until the confidence interval is tight enough.
+    Compared scenarios use the same seeds, so they share the random numbers of their common trains
+    and terminals and the noise of the difference is reduced.
+    """
+
+    def __init__(self, scenario: dict, other: dict = None, confidence: float = 0.95,
+                 relative_precision: Optional[float] = 0.02, absolute_precision: Optional[float] = None,
+                 min_replications: int = 5, max_replications: int = 1000, antithetic: bool = False,
+                 cache: ResultCache = None) -> None:
+        """
+        Constructor method
+        Params:
+            - scenario (dict): scenario, as accepted by scenario.build_simulator
+            - other (dict): scenario compared to the first one. If None, only the first one is measured.
+            - confidence (float): level of the confidence interval
+            - relative_precision (float): stop when the half width is below this fraction of the mean
+            - absolute_precision (float): stop when the half width is below this value, in ton
+            - min_replications (int): minimum number of observations before stopping
+            - max_replications (int): maximum number of observations
+            - antithetic (bool): flag to average each seed with its antithetic run in one observation
+            - cache (ResultCache): cache of results
+        """
+
+        if relative_precision is None and absolute_precision is None:
+            raise ReplicationException("Give a relative or an absolute precision")
+
+        self.scenario = scenario
+        self.other = other
+        self.confidence = confidence
+        self.relative_precision = relative_precision
+        self.absolute_precision = absolute_precision
+        self.min_replications = max(2, min_replications)
+        self.max_replications = max_replications
+        self.antithetic = antithetic
+        self.cache = cache
+
+        self.values: List[float] = list()
+        self.runs = 0
+
+    def tons(self, scenario: dict, seed: int) -> float:
+        runs = [False, True] if self.antithetic else [False]
+        self.runs += len(runs)
+
+        return sum(delivered_tons(scenario, seed, antithetic=antithetic, cache=self.cache)
+                   for antithetic in runs)/len(runs)
+
+    def observation(self, seed: int) -> float:
+        value = self.tons(self.scenario, seed)
+        if self.other is not None:
+            value -= self.tons(self.other, seed)
+        return value
+
+    def is_precise(self, mean: float, half_width: float) -> bool:
+        if self.absolute_precision is not None and half_width <= self.absolute_precision:
+            return True
+        return self.relative_precision is not None and half_width <= self.relative_precision*abs(mean)
+
+    def run(self) -> dict:
+        """
+        Run replications with the seeds 0, 1, 2... until the precision or the maximum number is reached
+        Return: mean, half width of the confidence interval, number of observations and of simulations
+        """
+
+        mean, half_width = math.nan, math.inf
+
+        while len(self.values) < self.max_replications:
+            self.values.append(self.observation(seed=len(self.values)))
+
+            if len(self.values) >= self.min_replications:
+                mean, half_width = confidence_interval(self.values, self.confidence)
+                if self.is_precise(mean, half_width):
+                    break
+
+        if len(self.values) < self.min_replications:
+            mean, half_width = confidence_interval(self.values, self.confidence)
+
+        return {
+            'mean': mean,
+            'half_width': half_width,
+            'replications': len(self.values),
+            'runs': self.runs,
+            'converged': self.is_precise(mean, half_width),
+        }
+
+
+class ReplicationException(Exception):
+    pass
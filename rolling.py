@@ -0,0 +1,219 @@
+import json
+import pickle
+import socket
+import time as clock
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from demand import Demand
+from event import Event
+from scenario import build_simulator
+from simulator import Simulator
+from train import Train
+
+
+class RollingHorizonPlanner:
+    """
+    Forward-looking planner fed by a stream of train position and stock updates.
+    The live simulator holds the last known state and the next event of each train. It is advanced
+    to the instant of each update, patched in place, and a copy of it is simulated for the next hours
+    to build the plan.
+
+    Updates are dictionaries with a 'type' and the instant 'time', in minutes:
+        {'type': 'train', 'time': time, 'id': train_id, 'location': terminal_id or 'railroad',
+         'destination': terminal_id, 'carg': carg, 'origin': terminal_id, 'arrival_time': time}
+        {'type': 'stock', 'time': time, 'id': terminal_id, 'stock': stock}
+        {'type': 'demand', 'time': time, 'origin': terminal_id, 'destination': terminal_id, 'total': total}
+    'origin' and 'arrival_time' are only needed for trains on the railroad. A loaded train at a terminal
+    with another destination is waiting to leave; without one, it is waiting to unload.
+    """
+
+    def __init__(self, scenario: dict, window_hours: float = 24) -> None:
+        """
+        Constructor method
+        Params:
+            - scenario (dict): scenario with the initial state, as accepted by scenario.build_simulator.
+                Its days limit the instants the planner can handle.
+            - window_hours (float): number of hours planned after each update
+        """
+
+        self.window = int(window_hours*60)
+
+        self.live: Simulator = build_simulator(scenario, log=False)
+        self.live.initiate_simulation()
+
+        self.plan: List[dict] = list()
+        self.last_update_seconds = 0.0
+
+    def get_train(self, train_id: str) -> Train:
+        train = next((train for train in self.live.trains if train.id == train_id), None)
+        if train is None:
+            raise RollingHorizonException(f"Train {train_id} does not exist")
+        return train
+
+    def get_terminal(self, terminal_id: str):
+        terminal = self.live.get_terminal_from_id(terminal_id=terminal_id)
+        if terminal is None:
+            raise RollingHorizonException(f"Terminal {terminal_id} does not exist")
+        return terminal
+
+    def apply(self, update: dict) -> List[dict]:
+        """
+        Patch the live state with the update and plan the next hours
+        Return: events of the plan
+        """
+
+        start = clock.perf_counter()
+
+        # call the events that happened before the update, so each plan starts from the present
+        self.live.run(until=update['time'])
+        self.live.time = max(self.live.time, update['time'])
+
+        if update['type'] == 'train':
+            self.update_train(update)
+        elif update['type'] == 'stock':
+            self.update_stock(update)
+        elif update['type'] == 'demand':
+            self.live.current_demand[update['origin']][update['destination']] = update['total']
+        else:
+            raise RollingHorizonException(f"{update['type']} is not a valid type of update")
+
+        self.plan = self.replan()
+        self.last_update_seconds = clock.perf_counter() - start
+
+        return self.plan
+
+    def update_stock(self, update: dict):
+        terminal = self.get_terminal(update['id'])
+        delta = update['stock'] - terminal.stock
+
+        terminal.stock = update['stock']
+        terminal.capacity = terminal.max_capacity - terminal.stock
+        if terminal.stock_timeline is not None:
+            terminal.stock_timeline.add(time=update['time'], delta=delta)
+
+    def update_train(self, update: dict):
+        """
+        Replace the pending event of the train by one built from its reported position.
+        Room and track reserved by the replaced event are given back.
+        """
+
+        train = self.get_train(update['id'])
+        time = update['time']
+        scheduler = self.live.scheduler
+
+        for event in [event for event in scheduler.events if event.train is train]:
+            scheduler.cancel_event(event)
+
+        carg = update.get('carg', 0)
+        location = update['location']
+        destination = self.get_terminal(update['destination']) if update.get('destination') else None
+
+        if location == 'railroad':
+            origin = self.get_terminal(update['origin'])
+            train.demand = None
+            if carg > 0:
+                train.load_train(Demand(product='', total=carg, origin=origin.id, destination=destination.id))
+            train.location = 'railroad'
+            train.destination = destination.id
+
+            # the travel in progress is a dispatch event that started now and ends at the reported arrival
+            event = Event(begin=time, end=max(update.get('arrival_time', time), time), type='dispatch',
+                          description=f'Train {train.id} is going from Terminal {origin.id} to Terminal {destination.id}',
+                          train=train, terminal=origin, demand=train.demand)
+        else:
+            terminal = self.get_terminal(location)
+            train.location = location
+            train.demand = None
+
+            # a loaded train with another destination is waiting to leave, otherwise it is waiting to unload
+            leaving = carg > 0 and destination is not None and destination.id != location
+            if leaving:
+                train.load_train(Demand(product='', total=carg, origin=location, destination=destination.id))
+            elif carg > 0:
+                train.load_train(Demand(product='', total=carg, origin=update.get('origin', location),
+                                        destination=location))
+            train.destination = None if destination is None else destination.id
+
+            if destination is None:
+                destination = self.live.find_best_next_destination(current_terminal=terminal, train=train,
+                                                                   end_last_event=time)
+
+            if leaving:
+                event = scheduler.build_dispatch_event(train=train, current_terminal=terminal,
+                                                       next_destination=destination, end_last_event=time)
+                event.demand = train.demand
+            elif not train.is_empty:
+                event = scheduler.build_unload_event(train=train, terminal=terminal, end_last_event=time)
+            elif terminal.has_demand:
+                event = scheduler.build_load_event(train=train, terminal=terminal,
+                                                   next_terminal=destination, end_last_event=time)
+            else:
+                event = scheduler.build_dispatch_event(train=train, current_terminal=terminal,
+                                                       next_destination=destination, end_last_event=time)
+
+        event.destination_terminal = destination
+        scheduler.append_event(event)
+
+    def replan(self) -> List[dict]:
+        """
+        Simulate a copy of the live state until the end of the window
+        Return: events of the plan, from the current instant on
+        """
+
+        now = self.live.time
+        plan: Simulator = pickle.loads(pickle.dumps(self.live, protocol=pickle.HIGHEST_PROTOCOL))
+        start = len(plan.scheduler.events_log)
+        plan.run(until=now + self.window)
+
+        return [info for info in plan.scheduler.events_log[start:] if info['begin'] >= now]
+
+    def consume(self, updates: Iterable[dict], on_plan: Callable[[List[dict]], None] = None):
+        """
+        Apply a stream of updates, calling on_plan with the new plan after each one
+        """
+
+        for update in updates:
+            plan = self.apply(update)
+            if on_plan is not None:
+                on_plan(plan)
+
+
+def tail_updates(path: str, poll_interval: float = 0.5, stop: Optional[Callable[[], bool]] = None) -> Iterator[dict]:
+    """
+    Follow a file of JSON lines, yielding each update as it is appended
+    Params:
+        - path (str): path of the file
+        - poll_interval (float): time, in seconds, to wait for new lines
+        - stop: function returning True when the stream must end. If None, the file is followed forever.
+    """
+
+    with open(path) as file:
+        buffer = ''
+        while True:
+            line = file.readline()
+            if line:
+                buffer += line
+                if buffer.endswith('\n'):
+                    if buffer.strip():
+                        yield json.loads(buffer)
+                    buffer = ''
+            elif stop is not None and stop():
+                break
+            else:
+                clock.sleep(poll_interval)
+
+
+def socket_updates(host: str = '127.0.0.1', port: int = 8766) -> Iterator[dict]:
+    """
+    Connect to a local feed of JSON lines, yielding each update until the feed closes the connection
+    """
+
+    with socket.create_connection((host, port)) as connection:
+        with connection.makefile('r') as feed:
+            for line in feed:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class RollingHorizonException(Exception):
+    pass
@@ -0,0 +1,89 @@
+from copy import deepcopy
+from simulator import Simulator
+from terminal import Terminal
+from train import Train
+from streams import build_stream
+from randomness import build_durations
+from calendars import build_calendar
+
+
+def build_train(info: dict) -> Train:
+    """
+    Build a train from a dictionary of parameters
+    """
+
+    train = Train(id=info['id'],
+                  velocity_empty=info['velocity_empty'],
+                  velocity_full=info['velocity_full'],
+                  max_capacity=info['max_capacity'],
+                  location=info.get('location'))
+    train.is_ready = info.get('is_ready', False)
+
+    return train
+
+
+def build_terminal(info: dict) -> Terminal:
+    """
+    Build a terminal from a dictionary of parameters
+    """
+
+    terminal = Terminal(id=info['id'],
+                        max_capacity=info['max_capacity'],
+                        load_time=info['load_time'],
+                        unload_time=info['unload_time'])
+    terminal.has_demand = info.get('has_demand', True)
+
+    return terminal
+
+
+def build_simulator(scenario: dict, seed: int = 0, antithetic: bool = False, **kwargs) -> Simulator:
+    """
+    Build a simulator from a scenario
+    Params:
+        - scenario (dict): dictionary with all the parameters of the simulation.
+            Structure:
+            {
+                'trains': [{'id': id, 'velocity_empty': velocity, 'velocity_full': velocity,
+                            'max_capacity': capacity, 'is_ready': flag, 'calendar': calendar (optional)}],
+                'terminals': [{'id': id, 'max_capacity': capacity, 'load_time': time,
+                               'unload_time': time, 'has_demand': flag, 'calendar': calendar (optional)}],
+                'days': days,
+                'initial_info': initial_info,
+                'terminals_graph': terminals_graph,
+                'tracks': tracks (optional),
+                'streams': [stream info, as accepted by streams.build_stream] (optional),
+                'durations': random durations, as accepted by randomness.build_durations (optional)
+            }
+            Calendars are accepted by calendars.build_calendar.
+        - seed (int): seed of the random durations
+        - antithetic (bool): flag to mirror the random numbers of the seed
+        - kwargs: other arguments of the simulator, like verbose and log
+
+    The scenario is not modified by the simulation.
+    """
+
+    durations = None
+    if scenario.get('durations') is not None:
+        durations = build_durations(scenario['durations'], seed=seed, antithetic=antithetic)
+
+    horizon = scenario['days']*24*60
+    trains = [build_train(info) for info in scenario['trains']]
+    terminals = [build_terminal(info) for info in scenario['terminals']]
+
+    # calendars are set before the simulator schedules the first events
+    for entity, info in zip(trains + terminals, scenario['trains'] + scenario['terminals']):
+        entity.calendar = build_calendar(info.get('calendar'), horizon)
+
+    simulator = Simulator(trains=trains,
+                          terminals=terminals,
+                          days=scenario['days'],
+                          initial_info=deepcopy(scenario['initial_info']),
+                          terminals_graph=deepcopy(scenario['terminals_graph']),
+                          tracks=scenario.get('tracks'),
+                          durations=durations,
+                          **kwargs)
+
+    for info in scenario.get('streams', []):
+        simulator.add_stream(build_stream(info))
+
+    return simulator
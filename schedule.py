@@ -1,24 +1,127 @@
-from event import Event
+from operator import attrgetter
+from event import Event, EventPool
 from terminal import Terminal
 from train import Train
+from track import TrackNetwork
+from randomness import DurationNoise
+from typing import Optional
 import pandas as pd
 
+event_begin = attrgetter('begin')
+
 class Schedule:
     """
     Model a calendar of events
     """
 
-    def __init__(self, verbose: bool = False) -> None:
+    def __init__(self, verbose: bool = False, hot_path: bool = False) -> None:
         """
         Constructor method
         Params:
             - verbose (bool): flag to print the steps of scheduling the events
+            - hot_path (bool): flag to reuse the called events and to log them without formatting their dates
         """
 
         self.events = list()
         self.events_log = list()
         self.verbose = verbose
 
+        self.log_listeners = list()  # functions called with the info of each logged event
+
+        self.tracks: Optional[TrackNetwork] = None  # segments with limited capacity. None means infinite capacity.
+
+        self.hot_path = hot_path
+        self.event_pool: Optional[EventPool] = EventPool() if hot_path else None
+
+        self.durations: Optional[DurationNoise] = None  # random durations. None means nominal durations.
+
+    def new_event(self, begin: int, end: int, type: str, train: Train, terminal: Terminal) -> Event:
+        """
+        Create a event, reusing a released one in the hot-path mode
+        """
+
+        if self.event_pool is not None:
+            return self.event_pool.acquire(begin=begin, end=end, type=type, train=train, terminal=terminal)
+
+        return Event(begin=begin, end=end, type=type, train=train, terminal=terminal)
+
+    def release_event(self, event: Event):
+        """
+        Give back a called event, once nothing refers to it anymore
+        """
+
+        if self.event_pool is not None:
+            self.event_pool.release(event)
+
+    def operation_time(self, type: str, train: Train, terminal: Terminal, nominal: int) -> int:
+        """
+        Returns: duration of the operation, drawn from the random durations if there are any
+        """
+
+        if self.durations is None:
+            return nominal
+        return self.durations.duration(type=type, train=train, terminal=terminal, nominal=nominal)
+
+    def next_window(self, type: str, train: Train, terminal: Terminal, time: int, duration: int) -> int:
+        """
+        Find the earliest instant, from the given one on, where the operation fits the calendars of the
+        terminal and of the train. The train is busy for the whole duration; for a dispatch, the terminal
+        only needs to be open at the departure.
+        """
+
+        calendars = [(calendar, length) for calendar, length in
+                     [(terminal.calendar, 0 if type == 'dispatch' else duration), (train.calendar, duration)]
+                     if calendar is not None]
+
+        # each calendar can only move the instant forward, so this stops once both agree
+        while calendars:
+            begin = time
+            for calendar, length in calendars:
+                begin = calendar.next_window(begin, length)
+            if begin == time:
+                break
+            time = begin
+
+        return time
+
+    def fit_operation(self, type: str, train: Train, terminal: Terminal, time: int, duration: int) -> int:
+        """
+        Move the start of a load or unload until it fits the calendars and does not overlap another
+        operation of the same type at the terminal, scheduled or in progress. The operation in progress
+        was popped from the schedule, so the start is kept after the free time of the terminal.
+        Moving the start for a calendar can create an overlap and the reverse, so both are checked
+        until the start stops moving.
+        """
+
+        free_time = terminal.free_unload_time if type == 'unload' else terminal.free_load_time
+        time = max(time, free_time)
+
+        while True:
+            time = self.next_window(type, train, terminal, time, duration)
+
+            overlapping = [event.end for event in self.events
+                           if event.terminal is terminal and event.type == type and event.train is not train
+                           and event.begin < time + duration and time < event.end]
+            if not overlapping:
+                return time
+
+            time = max(overlapping)
+
+    def cancel_event(self, event: Event):
+        """
+        Remove a scheduled event that will not happen, giving back the room and the track it reserved
+        """
+
+        self.events.remove(event)
+
+        if event.reserved_room:
+            event.terminal.reserve_room(amount=-event.reserved_room, time=event.begin)
+        if event.reserved_track:
+            segment = self.tracks.get_segment(event.terminal.id, event.destination_terminal.id)
+            segment.release(departure=event.begin, arrival=event.end)
+
+        self.release_event(event)
+
     def append_event(self,new_event: Event):
         self.events.append(new_event)
         self.sort_events()
@@ -26,21 +129,27 @@ class Schedule:
     def pop_event(self) -> Event:
         if len(self.events) > 0:
             event: Event = self.events.pop(0)
-            self.events_log.append(event.info)
+            info = event.compact_info if self.hot_path else event.info
+            self.events_log.append(info)
+            for listener in self.log_listeners:
+                listener(info)
             return event
 
     
     def sort_events(self):
-        self.events.sort(key= lambda ev: ev.begin)
+        self.events.sort(key=event_begin)
 
     
     def find_best_time_for_next_event(self, type_next_event:str,
-                                            terminal: Terminal, end_last_event:int):
+                                            terminal: Terminal, end_last_event:int, duration: int = None):
         """
         Calculate the best time to initiate the next event, based on the previuous one.
+        Params:
+            - duration (int): duration of the event. Defaults to the nominal one of the terminal.
         """    
 
-        duration = terminal.unload_time if type_next_event == 'unload' else terminal.load_time
+        if duration is None:
+            duration = terminal.unload_time if type_next_event == 'unload' else terminal.load_time
         free_time = terminal.free_unload_time if type_next_event == 'unload' else terminal.free_load_time
 
         scheduled_events = [event for event in self.events
@@ -84,70 +193,123 @@ class Schedule:
     def build_arrival_event(self, prev_event: Event, next_destination: Terminal=None):
 
         begin = max(prev_event.end, prev_event.terminal.free_recive_time)
-        event_description = f'Train {prev_event.train.id} arrived at Terminal {prev_event.destination_terminal.id}'
-
-        next_event = Event(begin=begin, end=begin, type='arrival',
-                            description=event_description,
-                            train=prev_event.train,
-                            terminal=prev_event.destination_terminal)
+        next_event = self.new_event(begin=begin, end=begin, type='arrival',
+                                    train=prev_event.train,
+                                    terminal=prev_event.destination_terminal)
         
         
         return next_event
     
 
 
-    def build_unload_event(self, train: Train, terminal: Terminal, end_last_event:int):
+    def find_best_time_for_unload(self, train: Train, terminal: Terminal, end_last_event:int, duration: int = None):
+        """
+        Calculate the best time to unload the train, delaying the unload until the terminal
+        has room for the carg and the unload fits the calendars. The room is reserved in the terminal's stock timeline.
+        If the terminal has no room until the end of the simulation, the train waits until then.
+        """
+
+        if duration is None:
+            duration = terminal.unload_time
+
+        amount = 0 if train.is_empty else train.demand.total
+        begin = end_last_event
+
+        while True:
+            # the helper can answer a time before the one asked; the unload only moves forward
+            begin = max(begin, self.find_best_time_for_next_event(type_next_event='unload',
+                                                                  terminal=terminal,
+                                                                  end_last_event=begin,
+                                                                  duration=duration))
+            begin = self.fit_operation('unload', train, terminal, begin, duration)
+            if amount <= 0:
+                return begin
+
+            time_with_room = terminal.earliest_time_with_room(amount=amount, time=begin)
+
+            if time_with_room is None:
+                begin = max(begin, terminal.stock_timeline.size)
+                break
+            if time_with_room <= begin:
+                break
+
+            begin = time_with_room
+
+        terminal.reserve_room(amount=amount, time=begin)
 
-        begin = self.find_best_time_for_next_event(type_next_event='unload',
-                                                    terminal= terminal,
-                                                    end_last_event=end_last_event)
+        return begin
 
-        event_description = f'Train {train.id} is unloading carg at Terminal {terminal.id}'
+    def build_unload_event(self, train: Train, terminal: Terminal, end_last_event:int):
+
+        duration = self.operation_time('unload', train, terminal, terminal.unload_time)
+        begin = self.find_best_time_for_unload(train=train, terminal=terminal, end_last_event=end_last_event,
+                                               duration=duration)
 
-        end = begin + terminal.unload_time
+        end = begin + duration
 
-        next_event = Event(begin=begin, end=end, type='unload',
-                            description=event_description, train=train,
-                            terminal= terminal)
+        next_event = self.new_event(begin=begin, end=end, type='unload', train=train, terminal=terminal)
+        next_event.reserved_room = 0 if train.is_empty else train.demand.total
         return next_event
     
     def build_load_event(self, train: Train, terminal: Terminal, next_terminal: Terminal, end_last_event:int):
 
+        duration = self.operation_time('load', train, terminal, terminal.load_time)
         begin = self.find_best_time_for_next_event(type_next_event='load',
                                                     terminal=terminal,
-                                                    end_last_event=end_last_event)
-
-        event_description = f'Train {train.id} is loading carg at Terminal {terminal.id}'
-
-        end = begin + terminal.load_time
+                                                    end_last_event=end_last_event,
+                                                    duration=duration)
+        begin = self.fit_operation('load', train, terminal, begin, duration)
+        end = begin + duration
 
-        next_event = Event(begin=begin, end=end, type='load',
-                            description=event_description, train=train,
-                            terminal=terminal)
+        next_event = self.new_event(begin=begin, end=end, type='load', train=train, terminal=terminal)
         
         next_event.destination_terminal = next_terminal
-
-        demand = terminal.build_demand_for_train(train=train,product_name='',destination=next_terminal.id)
-
-        next_event.demand = demand
                    
         return next_event
     
+    def reserve_track(self, origin: Terminal, destination: Terminal, time: int, travel_time: int,
+                      train: Train = None):
+        """
+        Delay a departure to the earliest slot respecting the capacity and headway of the track
+        and, if the train is given, the calendars of the train and of the origin. The slot is reserved.
+        Return: instant of the departure
+        """
+
+        if train is not None:
+            time = self.next_window('dispatch', train, origin, time, travel_time)
+
+        segment = None if self.tracks is None else self.tracks.get_segment(origin.id, destination.id)
+        if segment is None:
+            return time
+
+        while True:
+            departure = segment.earliest_departure(time=time, travel_time=travel_time)
+            if train is not None:
+                departure = self.next_window('dispatch', train, origin, departure, travel_time)
+            if departure == time:
+                break
+            time = departure
+
+        segment.reserve(departure=departure, arrival=departure + travel_time)
+
+        return departure
+
     def build_dispatch_event(self, train: Train, current_terminal: Terminal, next_destination: Terminal, end_last_event:int):
 
         begin = max(end_last_event, current_terminal.free_dispatch_time)
 
-        event_description = f'Train {train.id} is going from Terminal {current_terminal.id} to Terminal {next_destination.id}'
- 
         distance = current_terminal.graph_distances[next_destination.id]
-        travel_time = train.calculate_travel_time(distance=distance)
+        travel_time = self.operation_time('dispatch', train, current_terminal,
+                                          train.calculate_travel_time(distance=distance))
+        begin = self.reserve_track(origin=current_terminal, destination=next_destination,
+                                   time=begin, travel_time=travel_time, train=train)
         end = begin + travel_time
 
-        next_event = Event(begin=begin, end=end, type='dispatch',
-                            description=event_description, train=train,
-                            terminal=current_terminal)
+        next_event = self.new_event(begin=begin, end=end, type='dispatch', train=train, terminal=current_terminal)
 
         next_event.destination_terminal = next_destination
+        next_event.reserved_track = (self.tracks is not None
+                                     and self.tracks.get_segment(current_terminal.id, next_destination.id) is not None)
 
         return next_event
         
@@ -237,9 +399,11 @@ class Schedule:
         
         return line
     
-    def build_log_sheet(self):
+    def build_log_sheet(self, path: str = "simulation.xlsx"):
         """
         Create a sheet with the summary of the simulation
+        Params:
+            - path (str): path of the sheet
         """
 
         cycle = {
@@ -278,11 +442,16 @@ class Schedule:
             train = info['train']
             r = cycle[info['type']]
 
+            if 'begin_day' not in info:
+                # events logged in the hot-path mode
+                _, day, hour = Event.convert_minutes_to_date(info['begin'])
+                info = dict(info, begin_day=day, begin_hour=hour)
+
             line = self.create_line_of_summary(info, terminals,columns_terminals, train, terminal, r)
             
             total_info.append(line)
         
         df = pd.DataFrame(data=total_info, columns=columns_names)
      
-        df.to_excel("simulation.xlsx")
+        df.to_excel(path)
 
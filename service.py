@@ -0,0 +1,254 @@
+import asyncio
+import itertools
+import json
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Awaitable, Callable, Dict, Optional
+
+from scenario import build_simulator
+
+REQUEST_ID_PATTERN = re.compile(r'[\w-]+')  # request ids name the output directories
+
+
+def run_scenario(scenario: dict, request_id: str, output_dir: str = None, progress_queue=None) -> dict:
+    """
+    Run a simulation in a worker process
+    Params:
+        - scenario (dict): scenario of the simulation, as accepted by scenario.build_simulator
+        - request_id (str): id of the request, used to name its output files and tag its progress
+        - output_dir (str): directory of the output files. If None, no sheet is written.
+        - progress_queue: queue receiving (request_id, progress) tuples for each event,
+            and (request_id, None) when the simulation ends
+    Return: dictionary with the statistics, KPIs and events log of the simulation
+    """
+
+    simulator = build_simulator(scenario, log=False)
+
+    if progress_queue is not None:
+        counter = itertools.count()
+
+        def report(event, next_destination):
+            progress_queue.put((request_id, {'index': next(counter), 'time': event.begin,
+                                             'type': event.type, 'train': event.train.id,
+                                             'terminal': event.terminal.id}))
+
+        simulator.step_listeners.append(report)
+
+    output_path = None
+    if output_dir is not None:
+        request_dir = os.path.join(output_dir, request_id)
+        os.makedirs(request_dir, exist_ok=True)
+        output_path = os.path.join(request_dir, 'simulation.xlsx')
+
+    try:
+        simulator.simulate(output_path=output_path)
+    finally:
+        if progress_queue is not None:
+            progress_queue.put((request_id, None))
+
+    kpis = {name: frame.reset_index().to_dict('records') for name, frame in simulator.kpi.compute().items()}
+
+    result = {
+        'id': request_id,
+        'statistics': simulator.statistics,
+        'kpis': kpis,
+        'events_log': simulator.scheduler.events_log,
+        'sheet': output_path,
+    }
+
+    return result
+
+
+class SimulationService:
+    """
+    Asyncio service running concurrent simulation requests on a bounded process pool
+    """
+
+    def __init__(self, max_workers: int = None, output_dir: str = None) -> None:
+        """
+        Constructor method
+        Params:
+            - max_workers (int): maximum number of simulations running at the same time
+            - output_dir (str): directory where each request writes its own sheet. If None, no sheet is written.
+        """
+
+        self.max_workers = max_workers
+        self.output_dir = output_dir
+
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._progress_queue = None
+        self._dispatcher: Optional[threading.Thread] = None
+
+        self._listeners: Dict[str, tuple] = {}   # request id -> (event loop, asyncio queue of progress)
+        self._ids = itertools.count()
+
+    def start(self):
+        if self.executor is not None:
+            return
+
+        # forked workers would inherit the sockets of open connections and keep them alive
+        context = get_context('spawn')
+
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        self._manager = context.Manager()
+        self._progress_queue = self._manager.Queue()
+        self._dispatcher = threading.Thread(target=self._dispatch_progress, daemon=True)
+        self._dispatcher.start()
+
+    def close(self):
+        if self.executor is None:
+            return
+
+        self.executor.shutdown(wait=True)
+        self._progress_queue.put(None)
+        self._dispatcher.join()
+        self._manager.shutdown()
+        self.executor = None
+
+    def _dispatch_progress(self):
+        """
+        Forward the progress sent by the workers to the event loop waiting for it
+        """
+
+        while True:
+            item = self._progress_queue.get()
+            if item is None:
+                break
+
+            request_id, progress = item
+            listener = self._listeners.get(request_id)
+            if listener is not None:
+                loop, queue = listener
+                loop.call_soon_threadsafe(queue.put_nowait, progress)
+
+    async def submit(self, scenario: dict, request_id: str = None,
+                     on_progress: Callable[[dict], Awaitable[None]] = None) -> dict:
+        """
+        Run a simulation and wait for its result
+        Params:
+            - scenario (dict): scenario of the simulation
+            - request_id (str): unique id of the request. If None, a new one is generated.
+            - on_progress: coroutine function called with the progress of each event
+        """
+
+        self.start()
+
+        if request_id is None:
+            request_id = f"request-{next(self._ids)}"
+
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            raise ServiceException(f"Invalid request id {request_id!r}")
+
+        if request_id in self._listeners:
+            raise ServiceException(f"Request {request_id} is already running")
+
+        loop = asyncio.get_running_loop()
+        progress = asyncio.Queue()
+        self._listeners[request_id] = (loop, progress)
+
+        try:
+            future = loop.run_in_executor(self.executor, run_scenario, scenario, request_id,
+                                          self.output_dir, self._progress_queue)
+
+            def stop_on_error(done):
+                # a worker that dies before the end of the simulation never sends the final progress
+                if done.cancelled() or done.exception() is not None:
+                    progress.put_nowait(None)
+
+            future.add_done_callback(stop_on_error)
+
+            while True:
+                item = await progress.get()
+                if item is None:
+                    break
+                if on_progress is not None:
+                    await on_progress(item)
+
+            return await future
+
+        finally:
+            del self._listeners[request_id]
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve a connection speaking line-delimited JSON.
+        Each request line is {"id": id, "scenario": scenario}. The service answers with
+        {"id": id, "progress": progress} lines and then {"id": id, "result": result}
+        or {"id": id, "error": message}. Requests of the same connection run concurrently.
+        """
+
+        lock = asyncio.Lock()
+
+        async def send(message: dict):
+            async with lock:
+                writer.write(json.dumps(message, default=_to_json).encode() + b'\n')
+                await writer.drain()
+
+        async def run(request: dict):
+            request_id = request.get('id') or f"request-{next(self._ids)}"
+
+            async def on_progress(progress):
+                await send({'id': request_id, 'progress': progress})
+
+            try:
+                result = await self.submit(request['scenario'], request_id=request_id, on_progress=on_progress)
+                await send({'id': request_id, 'result': result})
+            except Exception as error:
+                await send({'id': request_id, 'error': f"{type(error).__name__}: {error}"})
+
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ServiceException(f"expected a JSON object, got {type(request).__name__}")
+                except (json.JSONDecodeError, ServiceException) as error:
+                    await send({'id': None, 'error': f"Invalid request: {error}"})
+                    continue
+
+                task = asyncio.create_task(run(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765) -> asyncio.AbstractServer:
+        self.start()
+        return await asyncio.start_server(self.handle_client, host=host, port=port)
+
+
+def _to_json(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class ServiceException(Exception):
+    pass
+
+
+async def main(host: str = '127.0.0.1', port: int = 8765):
+    service = SimulationService(output_dir='outputs')
+    server = await service.serve(host=host, port=port)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+
+    asyncio.run(main())
@@ -0,0 +1,310 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List
+import numpy as np
+
+from calendars import build_calendar
+from randomness import build_durations
+from simulator import Simulator
+from streams import build_stream
+from terminal import Terminal
+from train import Train
+
+TERMINAL_PARAMS = ['max_capacity', 'load_time', 'unload_time', 'has_demand']
+TRAIN_PARAMS = ['velocity_empty', 'velocity_full', 'max_capacity', 'is_ready']
+
+DEFAULTS = {'has_demand': True, 'is_ready': False}
+
+# entries of a scenario packed by SharedScenario.create. Others are refused, so none is silently dropped.
+SCENARIO_KEYS = {'trains', 'terminals', 'days', 'initial_info', 'terminals_graph',
+                 'tracks', 'streams', 'durations'}
+ENTITY_KEYS = {'id', 'location', 'calendar'} | set(TERMINAL_PARAMS) | set(TRAIN_PARAMS)
+
+
+class SharedScenarioHandle:
+    """
+    Small picklable reference to a scenario packed in shared memory
+    """
+
+    def __init__(self, name: str, layout: Dict[str, tuple]) -> None:
+        """
+        Constructor method
+        Params:
+            - name (str): name of the shared memory block
+            - layout (dict): offset, shape and dtype of each array of the block
+        """
+
+        self.name = name
+        self.layout = layout
+
+
+class SharedScenario:
+    """
+    Immutable part of a scenario packed in flat arrays of a shared memory block.
+    Workers attach to the block and read the arrays without copying them.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, layout: Dict[str, tuple], owner: bool) -> None:
+        """
+        Constructor method. Use SharedScenario.create or SharedScenario.attach.
+        """
+
+        self.memory = memory
+        self.layout = layout
+        self.owner = owner
+
+        self.arrays = {key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf, offset=offset)
+                       for key, (offset, shape, dtype) in layout.items()}
+        for array in self.arrays.values():
+            array.flags.writeable = owner
+
+        ids = json.loads(bytes(self.arrays['ids']).decode())
+        self.terminal_ids: List[str] = ids['terminals']
+        self.train_ids: List[str] = ids['trains']
+        self.days = ids['days']
+
+        # irregular entries (tracks, streams, random durations and calendars) are packed as json
+        self.extras = json.loads(bytes(self.arrays['extras']).decode())
+
+        self._graph = None
+
+    @classmethod
+    def create(cls, scenario: dict) -> 'SharedScenario':
+        """
+        Pack a scenario, as accepted by scenario.build_simulator, in a new shared memory block
+        """
+
+        unknown = set(scenario) - SCENARIO_KEYS
+        unknown |= {key for info in scenario['trains'] + scenario['terminals'] for key in info} - ENTITY_KEYS
+        if unknown:
+            raise SharedScenarioException(f"Entries {sorted(unknown)} can not be shared")
+
+        terminal_ids = [info['id'] for info in scenario['terminals']]
+        train_ids = [info['id'] for info in scenario['trains']]
+        terminal_index = {terminal_id: i for i, terminal_id in enumerate(terminal_ids)}
+        initial_info = scenario['initial_info']
+
+        distances = np.full((len(terminal_ids), len(terminal_ids)), np.nan)
+        for origin, connections in scenario['terminals_graph'].items():
+            for destination, distance in connections.items():
+                distances[terminal_index[origin], terminal_index[destination]] = distance
+
+        demand = np.full((len(terminal_ids), len(terminal_ids)), np.nan)
+        for origin, destinations in initial_info['demand'].items():
+            for destination, total in destinations.items():
+                demand[terminal_index[origin], terminal_index[destination]] = total
+
+        arrays = {
+            'distances': distances,
+            'demand': demand,
+            'terminals': np.array([[float(info.get(param, DEFAULTS.get(param))) for param in TERMINAL_PARAMS]
+                                   for info in scenario['terminals']]).reshape(-1, len(TERMINAL_PARAMS)),
+            'trains': np.array([[float(info.get(param, DEFAULTS.get(param))) for param in TRAIN_PARAMS]
+                                for info in scenario['trains']]).reshape(-1, len(TRAIN_PARAMS)),
+            'stock': np.array([initial_info['terminals'][terminal_id]['stock'] for terminal_id in terminal_ids],
+                              dtype=float),
+            'train_location': np.array([terminal_index[initial_info['trains'][train_id]['location']]
+                                        for train_id in train_ids], dtype=np.int32),
+            'train_destination': np.array([terminal_index[initial_info['trains'][train_id]['destination']]
+                                           for train_id in train_ids], dtype=np.int32),
+            'train_carg': np.array([initial_info['trains'][train_id]['carg'] for train_id in train_ids],
+                                   dtype=float),
+            'ids': np.frombuffer(json.dumps({'terminals': terminal_ids, 'trains': train_ids,
+                                             'days': scenario['days']}).encode(), dtype=np.uint8),
+            'extras': np.frombuffer(json.dumps({
+                'tracks': scenario.get('tracks'),
+                'streams': scenario.get('streams', []),
+                'durations': scenario.get('durations'),
+                'calendars': {'terminals': {info['id']: info['calendar'] for info in scenario['terminals']
+                                            if info.get('calendar')},
+                              'trains': {info['id']: info['calendar'] for info in scenario['trains']
+                                         if info.get('calendar')}},
+            }).encode(), dtype=np.uint8),
+        }
+
+        layout = {}
+        offset = 0
+        for key, array in arrays.items():
+            offset = -(-offset//8)*8   # keep every array aligned
+            layout[key] = (offset, array.shape, array.dtype.str)
+            offset += array.nbytes
+
+        memory = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+
+        for key, array in arrays.items():
+            offset, shape, dtype = layout[key]
+            np.ndarray(shape, dtype=array.dtype, buffer=memory.buf, offset=offset)[...] = array
+
+        return cls(memory=memory, layout=layout, owner=True)
+
+    @classmethod
+    def attach(cls, handle: SharedScenarioHandle) -> 'SharedScenario':
+        """
+        Attach to a scenario created by another process, without copying it
+        """
+
+        try:
+            memory = shared_memory.SharedMemory(name=handle.name, track=False)
+        except TypeError:
+            # before python 3.13 the block is always tracked. Workers started by the creator share
+            # its resource tracker, which registers each block only once.
+            memory = shared_memory.SharedMemory(name=handle.name)
+
+        return cls(memory=memory, layout=handle.layout, owner=False)
+
+    @property
+    def handle(self) -> SharedScenarioHandle:
+        return SharedScenarioHandle(name=self.memory.name, layout=self.layout)
+
+    @property
+    def terminals_graph(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns: dictionary of distances, built once per process. It is not modified by the simulator.
+        """
+
+        if self._graph is None:
+            distances = self.arrays['distances']
+            self._graph = {origin: {destination: _number(float(distances[i, j]))
+                                    for j, destination in enumerate(self.terminal_ids)
+                                    if not np.isnan(distances[i, j])}
+                           for i, origin in enumerate(self.terminal_ids)}
+
+        return self._graph
+
+    def build_simulator(self, overrides: dict = None, **kwargs) -> Simulator:
+        """
+        Build a simulator from the shared arrays
+        Params:
+            - overrides (dict): small per run changes.
+                Structure:
+                {
+                    'days': days,
+                    'terminals': {terminal_id: {param: value}},
+                    'trains': {train_id: {param: value}},
+                    'stock': {terminal_id: stock},
+                    'seed': seed of the random durations,
+                    'antithetic': flag to mirror the random numbers of the seed
+                }
+            - kwargs: other arguments of the simulator, like verbose and log
+        """
+
+        overrides = overrides or {}
+        terminal_overrides = overrides.get('terminals', {})
+        train_overrides = overrides.get('trains', {})
+        stock_overrides = overrides.get('stock', {})
+        days = overrides.get('days', self.days)
+        calendars = self.extras['calendars']
+
+        terminals = []
+        for i, terminal_id in enumerate(self.terminal_ids):
+            params = dict(zip(TERMINAL_PARAMS, map(_number, self.arrays['terminals'][i].tolist())))
+            params.update(terminal_overrides.get(terminal_id, {}))
+
+            terminal = Terminal(id=terminal_id, max_capacity=params['max_capacity'],
+                                load_time=params['load_time'], unload_time=params['unload_time'])
+            terminal.has_demand = bool(params['has_demand'])
+            terminal.calendar = build_calendar(calendars['terminals'].get(terminal_id), days*24*60)
+            terminals.append(terminal)
+
+        trains = []
+        for i, train_id in enumerate(self.train_ids):
+            params = dict(zip(TRAIN_PARAMS, map(_number, self.arrays['trains'][i].tolist())))
+            params.update(train_overrides.get(train_id, {}))
+
+            train = Train(id=train_id, velocity_empty=params['velocity_empty'],
+                          velocity_full=params['velocity_full'], max_capacity=params['max_capacity'])
+            train.is_ready = bool(params['is_ready'])
+            train.calendar = build_calendar(calendars['trains'].get(train_id), days*24*60)
+            trains.append(train)
+
+        demand = self.arrays['demand']
+        initial_info = {
+            'trains': {train_id: {'location': self.terminal_ids[self.arrays['train_location'][i]],
+                                  'destination': self.terminal_ids[self.arrays['train_destination'][i]],
+                                  'carg': _number(float(self.arrays['train_carg'][i]))}
+                       for i, train_id in enumerate(self.train_ids)},
+            'terminals': {terminal_id: {'stock': stock_overrides.get(terminal_id, _number(float(self.arrays['stock'][i])))}
+                          for i, terminal_id in enumerate(self.terminal_ids)},
+            'demand': {origin: {destination: _number(float(demand[i, j]))
+                                for j, destination in enumerate(self.terminal_ids)
+                                if not np.isnan(demand[i, j])}
+                       for i, origin in enumerate(self.terminal_ids)
+                       if not np.isnan(demand[i]).all()},
+        }
+
+        durations = None
+        if self.extras['durations'] is not None:
+            durations = build_durations(self.extras['durations'], seed=overrides.get('seed', 0),
+                                        antithetic=overrides.get('antithetic', False))
+
+        simulator = Simulator(trains=trains, terminals=terminals,
+                              days=days,
+                              initial_info=initial_info,
+                              terminals_graph=self.terminals_graph,
+                              tracks=self.extras['tracks'],
+                              durations=durations,
+                              **kwargs)
+
+        for info in self.extras['streams']:
+            simulator.add_stream(build_stream(info))
+
+        return simulator
+
+    def close(self):
+        """
+        Detach from the block. The creator also frees it.
+        """
+
+        self.arrays = {}
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _number(value: float):
+    """
+    Parameters are packed as floats: integer values, like times in minutes, are restored as int
+    """
+    return int(value) if value.is_integer() else value
+
+
+_attached: Dict[str, SharedScenario] = {}  # scenarios attached by this process, per block name
+
+
+def run_shared_scenario(handle: SharedScenarioHandle, overrides: dict = None) -> dict:
+    """
+    Run a simulation in a worker process, attaching to the shared scenario once per process
+    Return: statistics of the simulation
+    """
+
+    if handle.name not in _attached:
+        _attached[handle.name] = SharedScenario.attach(handle)
+
+    simulator = _attached[handle.name].build_simulator(overrides, log=False)
+    simulator.simulate(output_path=None)
+
+    return simulator.statistics
+
+
+def run_batch(scenario: dict, overrides: List[dict], max_workers: int = None) -> List[dict]:
+    """
+    Run one simulation per overrides on a process pool, sharing the scenario between the workers.
+    The seed of each replication goes in its overrides.
+    Return: statistics of each simulation, in the order of the overrides
+    """
+
+    with SharedScenario.create(scenario) as shared:
+        handle = shared.handle
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run_shared_scenario, [handle]*len(overrides), overrides))
+
+
+class SharedScenarioException(Exception):
+    pass
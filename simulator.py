@@ -5,6 +5,10 @@ from schedule import Schedule
 from train import Train
 from terminal import Terminal
 from demand import Demand
+from kpi import KPIEngine
+from track import TrackNetwork
+from streams import InflowQueue, RateStream
+from randomness import DurationNoise
 
 class Simulator:
     """
@@ -12,7 +16,8 @@ class Simulator:
     """
 
     def __init__(self, trains: List[Train], terminals: List[Terminal], 
-                days: int, initial_info: dict, terminals_graph:dict, verbose:bool = False) -> None:
+                days: int, initial_info: dict, terminals_graph:dict, verbose:bool = False, log:bool = True,
+                tracks: dict = None, hot_path: bool = False, durations: DurationNoise = None) -> None:
         """
         Constructor method
         Params:
@@ -32,6 +37,16 @@ class Simulator:
             {
                 'terminal_id': {connection_id: distance}
             }
+            - verbose (bool): flag to print the steps of scheduling the events
+            - log (bool): flag to print the events and the statistics of the simulation
+            - tracks (dict): capacity and headway of the track segments with limited capacity.
+                Other connections have infinite capacity.
+            Structure:
+            {
+                'terminal_id': {connection_id: {'capacity': capacity, 'headway': headway}}
+            }
+            - hot_path (bool): flag to reuse the called events and to log them without formatting their dates
+            - durations (DurationNoise): random durations of the operations. If None, the durations are fixed.
         """
 
         self.trains = trains
@@ -39,6 +54,7 @@ class Simulator:
         self.days = days
         self.initial_info = initial_info
         self.terminals_graph = terminals_graph
+        self.log = log
 
         self.time = 0  # instant of time of the simulation, in minutes
 
@@ -51,7 +67,7 @@ class Simulator:
 
         for terminal in self.termimals:
             terminal.graph_distances = self.terminals_graph[terminal.id]
-            terminal.stock = self.stock_per_terminal[terminal.id]
+            terminal.set_initial_stock(stock=self.stock_per_terminal[terminal.id], horizon=self.time_horizon)
         
         
         self.demand_control = [(0, { ter.id : {other_ter_id : 0 for other_ter_id in ter.graph_distances}
@@ -67,7 +83,17 @@ class Simulator:
         
         self.has_demand_left = any([ter.has_stock for ter in self.termimals])
 
-        self.scheduler = Schedule(verbose=verbose)
+        self.scheduler = Schedule(verbose=verbose, hot_path=hot_path)
+        self.scheduler.durations = durations
+        self.kpi = KPIEngine(horizon=self.time_horizon, schedule=self.scheduler)
+
+        if tracks is not None:
+            self.scheduler.tracks = TrackNetwork(tracks=tracks, horizon=self.time_horizon)
+
+        self.step_listeners = list()  # functions called with each event and its chosen next destination
+
+        self.inflows = InflowQueue()  # supply and demand streams, merged with the events as the clock advances
+        self.spilled_supply = {terminal.id: 0 for terminal in self.termimals}
         
         for train in self.trains:
             train.location = self.initial_info['trains'][train.id]['location']
@@ -102,7 +128,9 @@ class Simulator:
             
             train.is_ready = True
 
-            event.callback()
+            if self.log:
+                print(event.log_message)
+            event.apply()
 
             # update stock info
 
@@ -113,8 +141,10 @@ class Simulator:
             event_description = f"{train} is going from {terminal} to {destination_terminal}"
             distance = terminal.graph_distances[train.destination]
             travel_time = train.calculate_travel_time(distance)
+            begin = self.scheduler.reserve_track(origin=terminal, destination=destination_terminal,
+                                                 time=0, travel_time=travel_time, train=train)
 
-            event = Event(begin=0,end=travel_time,
+            event = Event(begin=begin,end=begin + travel_time,
                         type='dispatch',
                         description=event_description,
                         train=train,
@@ -127,6 +157,40 @@ class Simulator:
 
         
 
+    def add_train(self, train: Train, location: str, destination: str, time: int):
+        """
+        Add a empty train to a running simulation.
+        Params:
+            - train (Train): new train
+            - location (str): id of the terminal where the train starts
+            - destination (str): id of the first destination of the train
+            - time (int): instant the train becomes available, in minutes
+        """
+
+        train.location = location
+        train.destination = destination
+        train.demand = None
+
+        self.trains.append(train)
+        self.total_operated_demand_per_train[train.id] = 0
+
+        terminal = self.get_terminal_from_id(terminal_id=location)
+        destination_terminal = self.get_terminal_from_id(terminal_id=destination)
+
+        if terminal.has_demand:
+            event = self.scheduler.build_load_event(train=train,
+                                                    terminal=terminal,
+                                                    next_terminal=destination_terminal,
+                                                    end_last_event=time)
+        else:
+            event = self.scheduler.build_dispatch_event(train=train,
+                                                        current_terminal=terminal,
+                                                        next_destination=destination_terminal,
+                                                        end_last_event=time)
+
+        event.destination_terminal = destination_terminal
+        self.scheduler.append_event(event)
+
     def get_terminal_from_id(self, terminal_id:str) -> Terminal:
         """
         Returns: terminal object with the given id
@@ -139,9 +203,13 @@ class Simulator:
     
     def actualize_demand(self, new_demand: Demand, train: Train):
 
-        total = new_demand.total
-        origin_id = new_demand.origin
-        destination_id = new_demand.destination
+        self.operate_demand(total=new_demand.total, origin_id=new_demand.origin,
+                            destination_id=new_demand.destination, train=train)
+
+    def operate_demand(self, total: float, origin_id: str, destination_id: str, train: Train):
+        """
+        Register the total operated by the train from origin to destination
+        """
 
         new_demand_per_terminal = deepcopy(self.demand_control[-1][1])
 
@@ -173,7 +241,7 @@ class Simulator:
             terminal = self.get_terminal_from_id(terminal_id=train.location)
             loading_time[terminal.id] = terminal.load_time
 
-            destination_terminal_id = initial_info['trains'][train.id]['destination']
+            destination_terminal_id = self.initial_info['trains'][train.id]['destination']
             destination_terminal = next((ter for ter in self.termimals if ter.id==destination_terminal_id))    
      
 
@@ -218,6 +286,61 @@ class Simulator:
               
 
     
+    def add_stream(self, stream):
+        """
+        Add a supply or demand stream. Streams without an end stop at the time horizon.
+        """
+
+        if isinstance(stream, RateStream) and stream.end is None:
+            stream.end = self.time_horizon
+        self.inflows.add(stream)
+
+    def apply_inflows(self, time: int):
+        """
+        Apply the entries of the streams up to the given instant.
+        The supply of each terminal is summed and stored at once: the entries fall between two events,
+        and the projected stock is only queried from the current instant on.
+        Supply that does not fit in the terminal, counting the room reserved for scheduled unloads, is spilled.
+        """
+
+        supply = {}
+
+        for stream, entry_time, amount in self.inflows.pop_until(time):
+            if stream.type == 'demand':
+                self.current_demand[stream.terminal][stream.destination] += amount
+            else:
+                total, _ = supply.get(stream.terminal, (0, entry_time))
+                supply[stream.terminal] = (total + amount, entry_time)
+
+        for terminal_id, (amount, entry_time) in supply.items():
+            terminal = self.get_terminal_from_id(terminal_id=terminal_id)
+            if terminal.stock_timeline is not None:
+                room = terminal.max_capacity - terminal.stock_timeline.max_stock(entry_time)
+            else:
+                room = terminal.max_capacity - terminal.stock
+            stored = max(0, min(amount, room))
+
+            terminal.stock += stored
+            terminal.capacity -= stored
+            terminal.reserve_room(amount=stored, time=entry_time)
+            self.spilled_supply[terminal.id] += amount - stored
+
+    @property
+    def has_work(self) -> bool:
+        """
+        Returns: True if some terminal has stock and demand left, or if demand is still to come,
+            or supply to a terminal with demand left
+        """
+
+        demand_left = {ter.id: sum([dem for dem in self.current_demand[ter.id].values()]) > 0
+                       for ter in self.termimals}
+
+        if any([ter.has_stock and demand_left[ter.id] for ter in self.termimals]):
+            return True
+
+        return any([stream.type == 'demand' or demand_left.get(stream.terminal, False)
+                    for stream in self.inflows.pending_streams])
+
     def check_current_demand_by_terminal(self, current_terminal: Terminal, other_terminal: Terminal):
 
         if current_terminal.has_demand:
@@ -231,17 +354,32 @@ class Simulator:
         Determinates the best terminal to send the train, given the current conditions of the simulation.
         If the current terminal has demand, train is sent to the terminal minunum free unload time.
         Else, train is sent to the terminal with the minumum free load time or free dispatch time.
-        Time travel is also taken in account. 
+        Time travel is also taken in account. Terminals without room for the carg are avoided.
+        If no terminal has demand left from the current one, e.g. while a demand stream has not released
+        its next entry, any connected terminal is an option.
         """
     
         if train.destination is not None and train.location != 'railroad':
             return self.get_terminal_from_id(terminal_id=train.destination)
         
-        options = [terminal for terminal in self.termimals
+        connected = [terminal for terminal in self.termimals
                         if terminal != current_terminal 
-                        and current_terminal.graph_distances.get(terminal.id, None) is not None
-                        and self.check_current_demand_by_terminal(current_terminal, terminal)]
+                        and current_terminal.graph_distances.get(terminal.id, None) is not None]
 
+        options = [terminal for terminal in connected
+                        if self.check_current_demand_by_terminal(current_terminal, terminal)] or connected
+
+        if not options:
+            raise SimulatorException(f"{current_terminal} is not connected to any terminal")
+
+
+        if current_terminal.has_demand:
+            # send the train only to terminals with room for the carg, if there is any
+            amount = min(train.max_capacity, current_terminal.stock)
+            with_room = [ter for ter in options
+                         if ter.has_room(amount=amount,
+                                         time=end_last_event + train.calculate_travel_time(ter.graph_distances[current_terminal.id]))]
+            options = with_room or options
         
         if current_terminal.has_demand:
             options.sort(key=lambda ter: max(end_last_event + train.calculate_travel_time(ter.graph_distances[current_terminal.id]), ter.free_unload_time))
@@ -255,6 +393,16 @@ class Simulator:
 
 
     
+    @property
+    def statistics(self):
+
+        statistics = {
+            'operated_per_train': dict(self.total_operated_demand_per_train),
+            'operated_per_terminal': deepcopy(self.demand_control[-1][1]),
+        }
+
+        return statistics
+
     def print_statistics(self):
        
         print("*"*20)
@@ -271,52 +419,108 @@ class Simulator:
                 total = self.demand_control[-1][1][terminal][other_terminal]
                 print(f"Total volume from {terminal} to {other_terminal} = {total}")
 
+        print("KPIs")
+        self.kpi.print_kpis()
+
+    
+    def process_event(self, event: Event, next_destination: Terminal, log: bool = None):
+        """
+        Call the next event of the schedule and then schedule the one that follows it.
+        Params:
+            - event (Event): next event in the schedule
+            - next_destination (Terminal): terminal chosen as next destination of the event's train
+            - log (bool): flag to print the log message of the event. Defaults to the simulator's flag.
+        """
+
+        if log is None:
+            log = self.log
+
+        for listener in self.step_listeners:
+            listener(event, next_destination)
+
+        self.time = event.begin
+        self.apply_inflows(time=event.begin)
+
+        # call event and then schedule the next one
+        if log:
+            print(event.log_message)
+        event.apply()
+
+        if event.type == 'load':
+            # the load takes the stock of the terminal at its begin, with the supply arrived since it was scheduled
+            self.actualize_demand(new_demand=event.demand, train=event.train)
+        
+        self.scheduler.schedule_next_event(next_destination=next_destination)
+
+        self.scheduler.release_event(event)
+
     
-    def simulate(self):
+    def simulate(self, output_path: str = "simulation.xlsx"):
 
         """
         Main simulation loop.
+        Params:
+            - output_path (str): path of the sheet with the summary of the simulation. If None, no sheet is written.
         """
 
         self.initiate_simulation()
 
-        while len(self.scheduler.events) > 0 and self.time <= self.time_horizon:
+        self.run()
+
+        self.finish(output_path=output_path)
+
+    def run(self, until: int = None):
+        """
+        Call the events of the schedule until the end of the time horizon or of the demand.
+        Can be called again to resume a simulation restored from a snapshot.
+        Params:
+            - until (int): instant, in minutes, after which no event is called. Defaults to the time horizon.
+        """
+
+        last_time = self.time_horizon if until is None else min(until, self.time_horizon)
+
+        while len(self.scheduler.events) > 0 and self.time <= last_time:
 
-            if not any([ter.has_stock 
-                        and sum([dem for dem in self.current_demand[ter.id].values()]) > 0
-                        for ter in self.termimals]):
-                print("No stock or demand left")
+            if not self.has_work:
+                if self.log:
+                    print("No stock or demand left")
                 break
 
             event: Event = self.scheduler.events[0] # next event in the schedule
 
+            if event.begin > last_time:
+                # e.g. unloads waiting for room in a full terminal until the end of the simulation
+                break
+
             self.time = event.begin
+            self.apply_inflows(time=event.begin)
 
             next_destination = self.find_best_next_destination(current_terminal=event.terminal,
                                                             train=event.train,
                                                             end_last_event=event.end)
             
             
-            if event.demand is not None and event.type == 'load':
-                
-                self.actualize_demand(new_demand=event.demand, train=event.train)  
-
-            # call event and then schedule the next one
-            event.callback()
-            
-            simulator.scheduler.schedule_next_event(next_destination=next_destination)
+            self.process_event(event=event, next_destination=next_destination)
 
-            if not any([ter.has_stock 
-                        and sum([dem for dem in self.current_demand[ter.id].values()]) > 0
-                        for ter in self.termimals]):
-                print("No stock or demand left")
+            if not self.has_work:
+                if self.log:
+                    print("No stock or demand left")
                 break     
 
-        
-        # At the and, create a sheet with the summary of the simulation and print statistics
-        self.scheduler.build_log_sheet()
+    def finish(self, output_path: str = "simulation.xlsx"):
+        """
+        Create a sheet with the summary of the simulation and print statistics
+        """
+
+        if output_path is not None:
+            self.scheduler.build_log_sheet(path=output_path)
+
+        if self.log:
+            self.print_statistics()
+
 
-        self.print_statistics()
+class SimulatorException(Exception):
+    pass
 
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+import heapq
+from bisect import bisect_right
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+STREAM_TYPES = ('supply', 'demand')
+
+
+class TableStream:
+    """
+    Timestamped amounts of supply produced at a terminal, or of demand released between two terminals.
+    The table is kept as two arrays and read through a cursor, so no event is built before its time.
+    """
+
+    def __init__(self, type: str, times: Sequence[int], amounts: Sequence[float],
+                 terminal: str, destination: str = None) -> None:
+        """
+        Constructor method
+        Params:
+            - type (str): 'supply', added to the stock of the terminal,
+                or 'demand', added to the demand from the terminal to the destination
+            - times (list): instants of the entries, in minutes
+            - amounts (list): amount of each entry, in ton
+            - terminal (str): id of the terminal producing the supply, or origin of the demand
+            - destination (str): id of the destination of the demand
+        """
+
+        if type not in STREAM_TYPES:
+            raise StreamException(f"{type} is not a valid type of stream")
+
+        self.type = type
+        self.terminal = terminal
+        self.destination = destination
+
+        order = np.argsort(times, kind='stable')
+        self.times = np.asarray(times, dtype=np.int64)[order]
+        self.amounts = np.asarray(amounts, dtype=np.float64)[order]
+        self.cursor = 0
+
+    @classmethod
+    def from_csv(cls, path: str, type: str, terminal: str, destination: str = None) -> 'TableStream':
+        """
+        Read a table with one 'time,amount' row per entry
+        """
+
+        table = np.loadtxt(path, delimiter=',', ndmin=2)
+        return cls(type=type, times=table[:, 0], amounts=table[:, 1], terminal=terminal, destination=destination)
+
+    @property
+    def next_time(self) -> Optional[int]:
+        if self.cursor < len(self.times):
+            return int(self.times[self.cursor])
+        return None
+
+    def pop(self) -> float:
+        amount = float(self.amounts[self.cursor])
+        self.cursor += 1
+        return amount
+
+
+class RateStream:
+    """
+    Piecewise constant rate of supply or demand, integrated over steps of fixed length as the clock advances
+    """
+
+    def __init__(self, type: str, curve: Sequence[Tuple[int, float]], terminal: str, destination: str = None,
+                 step: int = 60, begin: int = 0, end: int = None) -> None:
+        """
+        Constructor method
+        Params:
+            - type (str): 'supply' or 'demand', as in TableStream
+            - curve (list): pairs (instant in minutes, rate in ton per hour) where the rate changes.
+                The rate is zero before the first instant.
+            - terminal (str): id of the terminal producing the supply, or origin of the demand
+            - destination (str): id of the destination of the demand
+            - step (int): time, in minutes, between two entries of the stream
+            - begin (int): instant of the first entry
+            - end (int): instant after which the stream stops. Defaults to the time horizon of the simulation.
+        """
+
+        if type not in STREAM_TYPES:
+            raise StreamException(f"{type} is not a valid type of stream")
+        if step <= 0:
+            raise StreamException("The step of a rate stream must be positive")
+
+        self.type = type
+        self.terminal = terminal
+        self.destination = destination
+        self.step = step
+        self.end = end
+        self.time = begin
+
+        curve = sorted(curve)
+        self.curve_times = [time for time, _ in curve]
+        self.rates = [rate/60 for _, rate in curve]   # per minute
+
+        # total produced until each change of rate
+        self.totals = [0.0]
+        for i in range(1, len(curve)):
+            self.totals.append(self.totals[-1] + self.rates[i - 1]*(self.curve_times[i] - self.curve_times[i - 1]))
+
+    def total_until(self, time: int) -> float:
+        i = bisect_right(self.curve_times, time) - 1
+        if i < 0:
+            return 0.0
+        return self.totals[i] + self.rates[i]*(time - self.curve_times[i])
+
+    @property
+    def next_time(self) -> Optional[int]:
+        if self.end is not None and self.time > self.end:
+            return None
+        return self.time
+
+    def pop(self) -> float:
+        """
+        Returns: amount produced from the current instant to the next step
+        """
+
+        amount = self.total_until(self.time + self.step) - self.total_until(self.time)
+        self.time += self.step
+        return amount
+
+
+class InflowQueue:
+    """
+    Streams merged by time with a heap holding only the next entry of each stream
+    """
+
+    def __init__(self) -> None:
+        self.streams: List = list()
+        self.heap: List[Tuple[int, int]] = list()  # (next time, index of the stream)
+
+    def add(self, stream):
+        self.streams.append(stream)
+        if stream.next_time is not None:
+            heapq.heappush(self.heap, (stream.next_time, len(self.streams) - 1))
+
+    @property
+    def pending(self) -> bool:
+        return len(self.heap) > 0
+
+    @property
+    def pending_streams(self) -> List:
+        return [self.streams[index] for _, index in self.heap]
+
+    @property
+    def next_time(self) -> Optional[int]:
+        return self.heap[0][0] if self.heap else None
+
+    def pop_until(self, time: int) -> Iterator[Tuple[object, int, float]]:
+        """
+        Take, in time order, the entries of all streams up to the given instant
+        Return: iterator of (stream, instant, amount)
+        """
+
+        while self.heap and self.heap[0][0] <= time:
+            entry_time, index = heapq.heappop(self.heap)
+            stream = self.streams[index]
+            amount = stream.pop()
+
+            if stream.next_time is not None:
+                heapq.heappush(self.heap, (stream.next_time, index))
+
+            yield stream, entry_time, amount
+
+
+def build_stream(info: dict):
+    """
+    Build a stream from a dictionary of parameters:
+        {'type': 'supply' or 'demand', 'terminal': id, 'destination': id (demand only),
+         and one of 'table': [[time, amount]], 'csv': path, or 'rate': [[time, ton per hour]], 'step': minutes}
+    """
+
+    params = dict(type=info['type'], terminal=info['terminal'], destination=info.get('destination'))
+
+    if 'table' in info:
+        table = np.asarray(info['table'], dtype=np.float64).reshape(-1, 2)
+        return TableStream(times=table[:, 0], amounts=table[:, 1], **params)
+    if 'csv' in info:
+        return TableStream.from_csv(info['csv'], **params)
+    if 'rate' in info:
+        return RateStream(curve=[tuple(point) for point in info['rate']], step=info.get('step', 60),
+                          begin=info.get('begin', 0), end=info.get('end'), **params)
+
+    raise StreamException("A stream needs a 'table', a 'csv' or a 'rate'")
+
+
+class StreamException(Exception):
+    pass
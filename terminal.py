@@ -1,6 +1,8 @@
-from typing import List
+from typing import List, Optional
 from demand import Demand
 from train import Train
+from timeline import StockTimeline
+from calendars import Calendar
 
 class Terminal:
     """
@@ -29,6 +31,8 @@ class Terminal:
 
         self.product = None                 # product storaged in terminal
         self.graph_distances = None
+        self.stock_timeline: Optional[StockTimeline] = None   # projected stock, used to check for room
+        self.calendar: Optional[Calendar] = None   # shift changes and maintenance. None means open 24/7.
 
         self.current_time = 0
 
@@ -43,6 +47,42 @@ class Terminal:
     def has_stock(self):
         return self.stock > 0
     
+    def set_initial_stock(self, stock: float, horizon: int):
+        """
+        Set the stock at the begin of the simulation and create the timeline of projected stock
+        Params:
+            - stock (float): initial stock, in ton
+            - horizon (int): time horizon of the simulation, in minutes
+        """
+
+        self.stock = stock
+        self.capacity = self.max_capacity - stock
+        self.stock_timeline = StockTimeline(size=horizon + 1, initial_stock=stock)
+
+    def earliest_time_with_room(self, amount: float, time: int) -> Optional[int]:
+        """
+        Returns: earliest instant from the given one on where the terminal can receive the amount
+            without overflowing, or None if there is no room until the end of the simulation
+        """
+
+        if self.stock_timeline is None:
+            return time
+        return self.stock_timeline.earliest_time_with_room(amount=amount, time=time,
+                                                           max_capacity=self.max_capacity)
+
+    def has_room(self, amount: float, time: int) -> bool:
+        if self.stock_timeline is None:
+            return True
+        return self.stock_timeline.has_room(amount=amount, time=time, max_capacity=self.max_capacity)
+
+    def reserve_room(self, amount: float, time: int):
+        """
+        Reserve room for a unload scheduled at the given instant
+        """
+
+        if self.stock_timeline is not None:
+            self.stock_timeline.add(time=time, delta=amount)
+
     @property
     def operation_time(self):
         if self.has_demand:
@@ -63,38 +103,49 @@ class Terminal:
         return demand
 
     
-    def load_train_in_terminal(self, train: Train, destination:str, current_time:int):
+    def load_train_in_terminal(self, train: Train, destination:str, current_time:int, end_time: int = None):
 
         self.current_time = current_time
+        if end_time is None:
+            end_time = current_time + self.load_time
         demand = self.build_demand_for_train(train=train, 
                                             product_name= self.product,
                                             destination=destination)
 
-        self.capacity -= demand.total
+        self.capacity += demand.total
         self.stock -= demand.total
+
+        # the room is only released at the end of the load
+        if self.stock_timeline is not None:
+            self.stock_timeline.add(time=end_time, delta=-demand.total)
         
         train.load_train(new_demand=demand)
-        self.free_load_time = self.current_time + self.load_time
+        self.free_load_time = end_time
         self.free_dispatch_time = self.free_load_time
 
         return demand      
 
 
-    def unload_train_in_terminal(self, train: Train, current_time:int):
+    def unload_train_in_terminal(self, train: Train, current_time:int, end_time: int = None):
 
         self.current_time = current_time
         self.free_recive_time = self.current_time 
         product, total = train.unload_train()
-        self.capacity -= total
+        if total is not None:
+            # the room was reserved in the stock timeline when the unload was scheduled
+            self.capacity -= total
+            self.stock += total
         self.product = product
-        self.free_unload_time = self.current_time + self.unload_time               
+        self.free_unload_time = self.current_time + self.unload_time if end_time is None else end_time               
 
     
-    def dispatch_train(self, train: Train, destination: str, current_time:int):
+    def dispatch_train(self, train: Train, destination: str, current_time:int, arrival_time: int = None):
         self.current_time = current_time
         train.location = 'railroad'
         train.destination = destination
-        train.arrival_time = current_time + train.calculate_travel_time(distance=self.graph_distances[destination])
+        if arrival_time is None:
+            arrival_time = current_time + train.calculate_travel_time(distance=self.graph_distances[destination])
+        train.arrival_time = arrival_time
         self.free_dispatch_time = current_time
     
     def register_train_arrival(self, train: Train, current_time:int):
@@ -0,0 +1,40 @@
+import os
+
+from distributed import FileSystemBackend
+
+
+def test_task_completed_after_its_lease_expired_is_not_claimed_again(tmp_path):
+    backend = FileSystemBackend(str(tmp_path))
+    backend.submit({'id': 'a--0', 'scenario_id': 'a', 'seed': 0})
+
+    task = backend.claim('worker-1', lease_seconds=600)
+    assert task['id'] == 'a--0'
+
+    # the lease of the first worker expires and the task is queued again before it completes
+    os.utime(backend.path('claimed', 'a--0'), (0, 0))
+    backend.requeue_expired(lease_seconds=600)
+    assert backend.names('pending') == ['a--0']
+
+    backend.complete('a--0', {'task_id': 'a--0', 'tons': 100})
+
+    assert backend.claim('worker-2', lease_seconds=600) is None
+    assert backend.names('pending') == []
+    assert backend.names('claimed') == []
+    assert [result['task_id'] for result in backend.pop_results()] == ['a--0']
+
+
+def test_second_completion_releases_the_claimed_task(tmp_path):
+    backend = FileSystemBackend(str(tmp_path))
+    backend.submit({'id': 'a--0', 'scenario_id': 'a', 'seed': 0})
+
+    backend.claim('worker-1', lease_seconds=600)
+    os.utime(backend.path('claimed', 'a--0'), (0, 0))
+    assert backend.claim('worker-2', lease_seconds=600)['id'] == 'a--0'
+
+    backend.complete('a--0', {'task_id': 'a--0', 'tons': 100})
+    backend.write('claimed', 'a--0', {'id': 'a--0'})   # claimed again by a late worker
+    backend.complete('a--0', {'task_id': 'a--0', 'tons': 100})
+
+    assert backend.names('claimed') == []
+    assert backend.names('pending') == []
+    assert len(backend.pop_results()) == 1
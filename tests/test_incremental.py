@@ -0,0 +1,42 @@
+import copy
+
+from incremental import IncrementalSimulator, TerminalEdit, TrainEdit
+from scenario import build_simulator
+
+
+SCENARIO = {
+    'trains': [{'id': str(i), 'velocity_empty': 20, 'velocity_full': 17, 'max_capacity': 1000}
+               for i in range(1, 5)],
+    'terminals': [{'id': '1', 'max_capacity': 80000, 'load_time': 420, 'unload_time': 360},
+                  {'id': '2', 'max_capacity': 80000, 'load_time': 420, 'unload_time': 360, 'has_demand': False},
+                  {'id': '3', 'max_capacity': 80000, 'load_time': 420, 'unload_time': 600, 'has_demand': False}],
+    'days': 10,
+    'terminals_graph': {'1': {'2': 340, '3': 340}, '2': {'1': 340}, '3': {'1': 340}},
+    'initial_info': {
+        'trains': {str(i): {'location': '1', 'destination': str(2 + i % 2), 'carg': 0} for i in range(1, 5)},
+        'terminals': {'1': {'stock': 30000}, '2': {'stock': 0}, '3': {'stock': 0}},
+        'demand': {'1': {'2': 15000, '3': 15000}, '2': {'1': 0}, '3': {'1': 0}},
+    },
+}
+
+
+def _full_run(edits):
+    scenario = copy.deepcopy(SCENARIO)
+    for edit in edits:
+        edit.apply_to_scenario(scenario)
+    simulator = build_simulator(scenario, log=False)
+    simulator.simulate(output_path=None)
+    return simulator
+
+
+def test_edits_of_a_terminal_or_train_reuse_the_events_before_they_are_read():
+    incremental = IncrementalSimulator(SCENARIO, snapshot_interval=20)
+
+    for edits in [[TerminalEdit('3', unload_time=200)], [TrainEdit('4', velocity_full=12)]]:
+        assert incremental.fork_point(edits) > 0
+
+        simulator = incremental.rerun(copy.deepcopy(edits))
+        expected = _full_run(edits)
+
+        assert simulator.scheduler.events_log == expected.scheduler.events_log
+        assert simulator.statistics == expected.statistics
@@ -0,0 +1,71 @@
+import signal
+
+from calendars import Calendar
+from demand import Demand
+from event import Event
+from randomness import DurationNoise, RandomStreams
+from schedule import Schedule
+from terminal import Terminal
+from train import Train
+
+
+def _timeout(signum, frame):
+    raise TimeoutError("find_best_time_for_unload did not return")
+
+
+def test_unload_waiting_for_room_does_not_move_backwards():
+    terminal = Terminal(id='2', max_capacity=1000, load_time=100, unload_time=100)
+    terminal.set_initial_stock(stock=900, horizon=3000)
+    terminal.stock_timeline.add(time=2000, delta=-900)
+
+    other = Train(id='0', velocity_empty=20, velocity_full=17, max_capacity=500)
+    schedule = Schedule()
+    schedule.append_event(Event(begin=50, end=150, type='unload', train=other, terminal=terminal))
+
+    train = Train(id='1', velocity_empty=20, velocity_full=17, max_capacity=500)
+    train.load_train(Demand(product='', total=500, origin='1', destination='2'))
+
+    signal.signal(signal.SIGALRM, _timeout)
+    signal.alarm(5)
+    try:
+        begin = schedule.find_best_time_for_unload(train=train, terminal=terminal, end_last_event=500)
+    finally:
+        signal.alarm(0)
+
+    assert begin == 2000
+    assert terminal.stock_timeline.stock_at(2000) == 500
+
+
+def test_load_slot_uses_the_drawn_duration():
+    terminal = Terminal(id='1', max_capacity=1000, load_time=100, unload_time=100)
+    destination = Terminal(id='2', max_capacity=1000, load_time=100, unload_time=100)
+
+    schedule = Schedule()
+    schedule.durations = DurationNoise(streams=RandomStreams(seed=0), load=(3, 3, 3))
+
+    other = Train(id='0', velocity_empty=20, velocity_full=17, max_capacity=500)
+    schedule.append_event(Event(begin=400, end=700, type='load', train=other, terminal=terminal))
+
+    train = Train(id='1', velocity_empty=20, velocity_full=17, max_capacity=500)
+    event = schedule.build_load_event(train=train, terminal=terminal, next_terminal=destination, end_last_event=200)
+
+    # the nominal load fits before the scheduled one, the drawn one does not
+    assert (event.begin, event.end) == (700, 1000)
+
+
+def test_load_does_not_overlap_the_load_in_progress():
+    terminal = Terminal(id='1', max_capacity=1000, load_time=420, unload_time=420)
+    terminal.calendar = Calendar([(100000, 100060)])
+    destination = Terminal(id='2', max_capacity=1000, load_time=420, unload_time=420)
+
+    # the load in progress was popped from the schedule: only the free time of the terminal knows it
+    terminal.free_load_time = 12420
+
+    schedule = Schedule()
+    other = Train(id='0', velocity_empty=20, velocity_full=17, max_capacity=500)
+    schedule.append_event(Event(begin=12660, end=13080, type='load', train=other, terminal=terminal))
+
+    train = Train(id='1', velocity_empty=20, velocity_full=17, max_capacity=500)
+    event = schedule.build_load_event(train=train, terminal=terminal, next_terminal=destination, end_last_event=12120)
+
+    assert event.begin == 13080
@@ -0,0 +1,54 @@
+from scenario import build_simulator
+
+
+def _scenario(streams):
+    return {
+        'trains': [{'id': str(i), 'velocity_empty': 20, 'velocity_full': 17, 'max_capacity': 1000,
+                    'location': '1'} for i in range(1, 4)],
+        'terminals': [{'id': '1', 'max_capacity': 80000, 'load_time': 420, 'unload_time': 360},
+                      {'id': '2', 'max_capacity': 80000, 'load_time': 420, 'unload_time': 360, 'has_demand': False},
+                      {'id': '3', 'max_capacity': 80000, 'load_time': 420, 'unload_time': 600, 'has_demand': False}],
+        'days': 10,
+        'terminals_graph': {'1': {'2': 340, '3': 340}, '2': {'1': 340}, '3': {'1': 340}},
+        'initial_info': {
+            'trains': {str(i): {'location': '1', 'destination': '2', 'carg': 0} for i in range(1, 4)},
+            'terminals': {'1': {'stock': 300}, '2': {'stock': 0}, '3': {'stock': 0}},
+            'demand': {'1': {'2': 4000, '3': 2000}, '2': {'1': 0}, '3': {'1': 0}},
+        },
+        'streams': streams,
+    }
+
+
+def test_supply_after_the_demand_is_met_ends_the_simulation():
+    simulator = build_simulator(_scenario([{'type': 'supply', 'terminal': '1', 'rate': [[0, 100]]}]), log=False)
+    simulator.simulate(output_path=None)
+
+    assert all(total <= 0 for total in simulator.current_demand['1'].values())
+    assert simulator.time < simulator.time_horizon
+
+
+def test_loads_count_the_supply_arrived_after_they_were_scheduled():
+    simulator = build_simulator(_scenario([{'type': 'supply', 'terminal': '1', 'rate': [[0, 100]]}]), log=False)
+    simulator.simulate(output_path=None)
+
+    loaded = {}
+    for info in simulator.scheduler.events_log:
+        if info['type'] == 'load':
+            loaded[info['train']] = loaded.get(info['train'], 0) + info['tons']
+
+    assert simulator.total_operated_demand_per_train == loaded
+
+
+def test_next_destination_while_waiting_for_a_demand_stream():
+    simulator = build_simulator(_scenario([{'type': 'demand', 'terminal': '1', 'destination': '3',
+                                            'table': [[5000, 1000]]}]), log=False)
+    simulator.initiate_simulation()
+    for destination in simulator.current_demand['1']:
+        simulator.current_demand['1'][destination] = 0
+
+    train = simulator.trains[0]
+    train.destination = None
+    terminal = simulator.get_terminal_from_id('1')
+
+    assert simulator.has_work
+    assert simulator.find_best_next_destination(current_terminal=terminal, train=train, end_last_event=0) is not None
@@ -0,0 +1,168 @@
+from typing import Optional
+
+
+class Timeline:
+    """
+    Value along the time, indexed by minute.
+    A change of value applies from its instant to the end of the timeline. A sparse segment tree
+    keeps the maximum value of each range of minutes, so range checks cost O(log n)
+    instead of replaying the scheduled events.
+    """
+
+    def __init__(self, size: int, initial_value: float = 0) -> None:
+        """
+        Constructor method
+        Params:
+            - size (int): number of minutes covered by the timeline. Later instants are mapped to the last minute.
+            - initial_value (float): value at the begin of the timeline
+        """
+
+        self.size = max(1, size)
+        self.initial_value = initial_value
+
+        # nodes are created when touched. The maximum of a node includes its own pending addition,
+        # but not the ones of its ancestors.
+        self.max = {}
+        self.lazy = {}
+
+    def clamp(self, time: int) -> int:
+        return min(max(int(time), 0), self.size - 1)
+
+    def add(self, time: int, delta: float):
+        """
+        Add a change of value from the given instant to the end of the timeline
+        """
+
+        self._add(1, 0, self.size, self.clamp(time), delta)
+
+    def _add(self, node: int, lo: int, hi: int, begin: int, delta: float):
+
+        if hi <= begin:
+            return
+
+        if begin <= lo:
+            self.max[node] = self.max.get(node, 0) + delta
+            self.lazy[node] = self.lazy.get(node, 0) + delta
+            return
+
+        mid = (lo + hi)//2
+        self._add(2*node, lo, mid, begin, delta)
+        self._add(2*node + 1, mid, hi, begin, delta)
+
+        self.max[node] = max(self.max.get(2*node, 0), self.max.get(2*node + 1, 0)) + self.lazy.get(node, 0)
+
+    def value_at(self, time: int) -> float:
+        """
+        Returns: value at the given instant
+        """
+
+        position = self.clamp(time)
+        node, lo, hi = 1, 0, self.size
+        value = self.initial_value
+
+        while True:
+            value += self.lazy.get(node, 0)
+            if hi - lo == 1 or node not in self.max:
+                return value
+
+            mid = (lo + hi)//2
+            if position < mid:
+                node, hi = 2*node, mid
+            else:
+                node, lo = 2*node + 1, mid
+
+    def max_value(self, begin: int, end: int = None) -> float:
+        """
+        Returns: maximum value in the range of minutes [begin, end). By default, until the end of the timeline.
+        """
+
+        end = self.size if end is None else min(max(int(end), 1), self.size)
+
+        return self.initial_value + self._max(1, 0, self.size, self.clamp(begin), end)
+
+    def _max(self, node: int, lo: int, hi: int, begin: int, end: int) -> float:
+
+        if begin <= lo and hi <= end or node not in self.max:
+            return self.max.get(node, 0)
+
+        mid = (lo + hi)//2
+        best = float('-inf')
+        if mid < end:
+            best = self._max(2*node + 1, mid, hi, begin, end)
+        if begin < mid:
+            best = max(best, self._max(2*node, lo, mid, begin, end))
+
+        return best + self.lazy.get(node, 0)
+
+    def last_time_above(self, begin: int, threshold: float, end: int = None) -> int:
+        """
+        Returns: last instant in the range [begin, end) with value above the threshold, or -1.
+            By default, until the end of the timeline.
+        """
+
+        end = self.size if end is None else min(max(int(end), 1), self.size)
+
+        return self._last_above(1, 0, self.size, self.clamp(begin), end, threshold - self.initial_value, 0)
+
+    def _last_above(self, node: int, lo: int, hi: int, begin: int, end: int,
+                    threshold: float, pending: float) -> int:
+
+        if hi <= begin or end <= lo or self.max.get(node, 0) + pending <= threshold:
+            return -1
+
+        if hi - lo == 1 or node not in self.max:
+            # the whole range shares the same value
+            return min(hi, end) - 1
+
+        pending += self.lazy.get(node, 0)
+        mid = (lo + hi)//2
+
+        last = self._last_above(2*node + 1, mid, hi, begin, end, threshold, pending)
+        if last == -1:
+            last = self._last_above(2*node, lo, mid, begin, end, threshold, pending)
+
+        return last
+
+
+class StockTimeline(Timeline):
+    """
+    Projected stock of a terminal along the time, used to check if there is room in the terminal
+    """
+
+    def __init__(self, size: int, initial_stock: float = 0) -> None:
+        """
+        Constructor method
+        Params:
+            - size (int): number of minutes covered by the timeline. Later instants are mapped to the last minute.
+            - initial_stock (float): stock at the begin of the timeline, in ton
+        """
+
+        super().__init__(size=size, initial_value=initial_stock)
+
+    def stock_at(self, time: int) -> float:
+        return self.value_at(time)
+
+    def max_stock(self, begin: int) -> float:
+        """
+        Returns: maximum projected stock from the given instant to the end of the timeline
+        """
+        return self.max_value(begin)
+
+    def earliest_time_with_room(self, amount: float, time: int, max_capacity: float) -> Optional[int]:
+        """
+        Find the earliest instant, from the given one on, where the amount can be added to the stock
+        without exceeding the maximum capacity until the end of the timeline.
+        Return: the instant, or None if there is no room until the end of the timeline
+        """
+
+        last = self.last_time_above(time, max_capacity - amount)
+
+        if last == -1:
+            return time
+        if last + 1 >= self.size:
+            return None
+
+        return last + 1
+
+    def has_room(self, amount: float, time: int, max_capacity: float) -> bool:
+        return self.max_stock(time) + amount <= max_capacity
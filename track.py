@@ -0,0 +1,130 @@
+from bisect import bisect_left, insort
+from typing import Dict, Optional, Tuple
+from timeline import Timeline
+
+
+class TrackSegment:
+    """
+    Class to model a segment of railroad between two terminals, used in both directions
+    """
+
+    def __init__(self, terminals: Tuple[str, str], capacity: int, headway: int, horizon: int) -> None:
+        """
+        Constructor method
+        Params:
+            - terminals (tuple): ids of the terminals at the ends of the segment
+            - capacity (int): maximum number of trains on the segment at the same time
+            - headway (int): minimum time (in min) between two departures on the segment
+            - horizon (int): time horizon of the simulation, in minutes
+        """
+
+        self.terminals = terminals
+        self.capacity = capacity
+        self.headway = headway
+
+        self.occupancy = Timeline(size=horizon + 1)   # number of trains on the segment along the time
+        self.departures = list()                       # sorted instants of the reserved departures
+
+    def conflicting_departure(self, time: int) -> Optional[int]:
+        """
+        Returns: latest reserved departure closer than the headway to the given instant, or None
+        """
+
+        if self.headway <= 0:
+            return None
+
+        index = bisect_left(self.departures, time + self.headway) - 1
+        if index >= 0 and self.departures[index] > time - self.headway:
+            return self.departures[index]
+
+        return None
+
+    def earliest_departure(self, time: int, travel_time: int) -> int:
+        """
+        Find the earliest departure, from the given instant on, respecting the headway
+        and the capacity of the segment during the whole travel.
+        Each probe costs O(log n) and jumps over one conflicting reservation.
+        """
+
+        departure = time
+
+        while departure < self.occupancy.size:
+
+            last_full = self.occupancy.last_time_above(departure, self.capacity - 1,
+                                                       end=departure + max(travel_time, 1))
+            if last_full != -1:
+                departure = last_full + 1
+                continue
+
+            conflict = self.conflicting_departure(departure)
+            if conflict is not None:
+                departure = conflict + self.headway
+                continue
+
+            break
+
+        return departure
+
+    def reserve(self, departure: int, arrival: int):
+        self.occupancy.add(time=departure, delta=1)
+        self.occupancy.add(time=max(arrival, departure + 1), delta=-1)
+        insort(self.departures, departure)
+
+    def release(self, departure: int, arrival: int):
+        """
+        Undo a reservation made with the same instants
+        """
+
+        self.occupancy.add(time=departure, delta=-1)
+        self.occupancy.add(time=max(arrival, departure + 1), delta=1)
+        index = bisect_left(self.departures, departure)
+        if index < len(self.departures) and self.departures[index] == departure:
+            del self.departures[index]
+
+
+class TrackNetwork:
+    """
+    Track segments of the railroad, per pair of terminals
+    """
+
+    def __init__(self, tracks: dict, horizon: int) -> None:
+        """
+        Constructor method
+        Params:
+            - tracks (dict): capacity and headway of the segments with limited capacity.
+                Connections missing are treated as infinite capacity.
+                Structure:
+                {
+                    'terminal_id': {connection_id: {'capacity': capacity, 'headway': headway}}
+                }
+            - horizon (int): time horizon of the simulation, in minutes
+        """
+
+        self.segments: Dict[frozenset, TrackSegment] = {}
+
+        for origin, connections in tracks.items():
+            for destination, info in connections.items():
+                key = frozenset((origin, destination))
+                if key not in self.segments:
+                    self.segments[key] = TrackSegment(terminals=(origin, destination),
+                                                      capacity=info.get('capacity', 1),
+                                                      headway=info.get('headway', 0),
+                                                      horizon=horizon)
+
+    def get_segment(self, origin: str, destination: str) -> Optional[TrackSegment]:
+        return self.segments.get(frozenset((origin, destination)))
+
+    def reserve_departure(self, origin: str, destination: str, time: int, travel_time: int) -> int:
+        """
+        Reserve the segment for the earliest feasible departure from the given instant on
+        Return: instant of the departure
+        """
+
+        segment = self.get_segment(origin, destination)
+        if segment is None:
+            return time
+
+        departure = segment.earliest_departure(time=time, travel_time=travel_time)
+        segment.reserve(departure=departure, arrival=departure + travel_time)
+
+        return departure
@@ -1,5 +1,7 @@
 import imp
+from typing import Optional
 from demand import Demand
+from calendars import Calendar
 
 class Train:
     """
@@ -33,6 +35,8 @@ class Train:
         self.travel_time = None   # time in minutes to complete the travel from on terminmal to another
         self.is_ready = False
 
+        self.calendar: Optional[Calendar] = None  # maintenance windows. None means always available.
+
     
     @property
     def is_empty(self):